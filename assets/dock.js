@@ -0,0 +1,128 @@
+(function(){
+  var MAP_NAME = '__MAP_NAME__';
+
+  // Folium defines the map and its layers in an inline script at the end of <body>,
+  // so they exist by DOMContentLoaded at the latest: check once now, once then.
+  function waitFor(name, cb) {
+    if (window[name]) return cb(window[name]);
+    function check() {
+      if (window[name]) cb(window[name]);
+      else console.warn("mapdock: missing " + name);
+    }
+    if (document.readyState === "loading") document.addEventListener("DOMContentLoaded", check, { once: true });
+    else check();
+  }
+
+  waitFor(MAP_NAME, function(map){
+    var dock = document.getElementById("mapdock");
+    var btnToggle = document.getElementById("mapdockToggle");
+
+    function applyState(collapsed){
+      dock.classList.toggle("mapdock-collapsed", collapsed);
+      btnToggle.textContent = collapsed ? "Show" : "Hide";
+      btnToggle.classList.toggle("dock-on", !collapsed);
+    }
+
+    // restore
+    try {
+      var st = localStorage.getItem("mapdock_collapsed");
+      applyState(st === "1");
+    } catch(e) {
+      applyState(false);
+    }
+
+    btnToggle.addEventListener("click", function(ev){
+      ev.preventDefault(); ev.stopPropagation();
+      var collapsed = !dock.classList.contains("mapdock-collapsed");
+      applyState(collapsed);
+      try { localStorage.setItem("mapdock_collapsed", collapsed ? "1" : "0"); } catch(e){}
+    });
+
+    // tabs
+    function setTab(which) {
+      document.querySelectorAll("#mapdock .tab").forEach(function(t) {
+        t.classList.toggle("active", t.getAttribute("data-tab") === which);
+      });
+      document.getElementById("panelLegend").classList.toggle("active", which === "legend");
+      document.getElementById("panelLayers").classList.toggle("active", which === "layers");
+    }
+    document.querySelectorAll("#mapdock .tab").forEach(function(t){
+      t.addEventListener("click", function(ev){
+        ev.preventDefault(); ev.stopPropagation();
+        setTab(t.getAttribute("data-tab"));
+      });
+    });
+
+    // keep map from stealing interactions when hovering dock
+    dock.addEventListener("mouseenter", function(){
+      try {
+        map.dragging.disable();
+        map.scrollWheelZoom.disable();
+        map.doubleClickZoom.disable();
+        map.boxZoom.disable();
+        map.keyboard.disable();
+      } catch(e){}
+    });
+    dock.addEventListener("mouseleave", function(){
+      try {
+        map.dragging.enable();
+        map.scrollWheelZoom.enable();
+        map.doubleClickZoom.enable();
+        map.boxZoom.enable();
+        map.keyboard.enable();
+      } catch(e){}
+    });
+
+    // layers toggle hookup
+    function syncCheckboxes() {
+      document.querySelectorAll("#panelLayers input[type='checkbox'][data-layer]").forEach(function(cb){
+        var lname = cb.getAttribute("data-layer");
+        var layerObj = window[lname];
+        if (!layerObj) {
+          // layer might be missing if name wrong
+          cb.checked = false;
+          cb.disabled = true;
+          return;
+        }
+        cb.checked = map.hasLayer(layerObj);
+      });
+    }
+
+    function attach() {
+      document.querySelectorAll("#panelLayers input[type='checkbox'][data-layer]").forEach(function(cb){
+        cb.addEventListener("change", function(ev){
+          ev.preventDefault(); ev.stopPropagation();
+          var lname = cb.getAttribute("data-layer");
+          var layerObj = window[lname];
+          if (!layerObj) return;
+
+          if (cb.checked) map.addLayer(layerObj);
+          else map.removeLayer(layerObj);
+        });
+      });
+
+      // whenever overlays change (from code or elsewhere), resync
+      map.on("overlayadd", syncCheckboxes);
+      map.on("overlayremove", syncCheckboxes);
+
+      // initial sync
+      syncCheckboxes();
+    }
+
+    // some layers may be defined after map init; poll a bit
+    var tries = 0;
+    var poll = setInterval(function(){
+      tries++;
+      // if at least one layer resolves, attach, then stop
+      var any = false;
+      document.querySelectorAll("#panelLayers input[type='checkbox'][data-layer]").forEach(function(cb){
+        var lname = cb.getAttribute("data-layer");
+        if (window[lname]) any = true;
+      });
+      if (any || tries > 160) {
+        clearInterval(poll);
+        attach();
+      }
+    }, 50);
+  });
+})();
@@ -12,6 +12,7 @@ Optional:
 from __future__ import annotations
 
 import argparse
+import mmap
 import os
 import shutil
 import zipfile
@@ -19,6 +20,8 @@ from pathlib import Path
 
 import requests
 
+from http_session import make_session
+
 
 DEFAULT_URL = "https://raw.githubusercontent.com/owlmaps/UAControlMapBackups/master/latest.kmz"
 
@@ -27,10 +30,10 @@ def ensure_dir(p: Path) -> None:
     p.mkdir(parents=True, exist_ok=True)
 
 
-def download_file(url: str, out_path: Path, timeout: int = 60) -> None:
+def download_file(session: requests.Session, url: str, out_path: Path, timeout: int = 60) -> None:
     out_path.parent.mkdir(parents=True, exist_ok=True)
 
-    with requests.get(url, stream=True, timeout=timeout) as r:
+    with session.get(url, stream=True, timeout=timeout) as r:
         r.raise_for_status()
         with open(out_path, "wb") as f:
             for chunk in r.iter_content(chunk_size=1024 * 256):
@@ -38,30 +41,72 @@ def download_file(url: str, out_path: Path, timeout: int = 60) -> None:
                     f.write(chunk)
 
 
-def extract_kmz(kmz_path: Path, extract_dir: Path) -> None:
-    ensure_dir(extract_dir)
-    with zipfile.ZipFile(kmz_path, "r") as z:
-        z.extractall(extract_dir)
+class MappedFile(mmap.mmap):
+    """Read-only mmap that ZipFile accepts as a file object (mmap.seekable() is 3.13+)."""
 
+    def seekable(self) -> bool:
+        return True
 
-def move_artifacts(extract_dir: Path, assets_dir: Path) -> None:
-    kml_src = extract_dir / "doc.kml"
-    images_src = extract_dir / "images"
 
-    if not kml_src.exists():
-        raise FileNotFoundError(f"Missing doc.kml after extraction in {extract_dir}")
+def extract_selected(kmz_path: Path, assets_dir: Path) -> int:
+    """
+    Extract doc.kml and images/* from the KMZ into assets_dir.
+    Members are streamed into assets_dir/.tmp_extract first and only swapped into place
+    once all of them have been written, so a corrupt member or a full disk leaves the
+    previous doc.kml / images untouched. Other members (previews, thumbnails, ...) are
+    never written to disk.
+    Returns the number of images extracted.
+    """
+    # Smaller than an end-of-central-directory record: not a zip (and not mappable if empty)
+    if kmz_path.stat().st_size < 22:
+        raise zipfile.BadZipFile(f"File is too small to be a zip archive: {kmz_path}")
 
     ensure_dir(assets_dir)
+    tmp_dir = assets_dir / ".tmp_extract"
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
 
-    # move doc.kml
-    shutil.copy2(kml_src, assets_dir / "doc.kml")
+    try:
+        # The archive is memory-mapped and handed to ZipFile directly, so member reads
+        # are served from the page cache instead of a read() syscall per chunk.
+        with open(kmz_path, "rb") as f, MappedFile(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+                zipfile.ZipFile(mm, "r") as z:
+            members = z.infolist()
+            if not any(zi.filename == "doc.kml" for zi in members):
+                raise FileNotFoundError(f"Missing doc.kml in {kmz_path}")
+
+            ensure_dir(tmp_dir)
+            n_images = 0
+            for zi in members:
+                if zi.is_dir():
+                    continue
+                if zi.filename == "doc.kml":
+                    dst = tmp_dir / "doc.kml"
+                elif zi.filename.startswith("images/"):
+                    rel = Path(zi.filename).relative_to("images")
+                    if ".." in rel.parts:
+                        continue
+                    dst = tmp_dir / "images" / rel
+                    ensure_dir(dst.parent)
+                    n_images += 1
+                else:
+                    continue
+
+                with z.open(zi) as src, open(dst, "wb") as dst_f:
+                    shutil.copyfileobj(src, dst_f, length=1024 * 1024)
+
+        # Everything is on disk: swap it in (images only if the KMZ has any, as before)
+        os.replace(tmp_dir / "doc.kml", assets_dir / "doc.kml")
+        if n_images:
+            images_dst = assets_dir / "images"
+            old_images = tmp_dir / "images_old"
+            if images_dst.exists():
+                os.replace(images_dst, old_images)
+            os.replace(tmp_dir / "images", images_dst)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
 
-    # move images folder if exists
-    if images_src.exists() and images_src.is_dir():
-        images_dst = assets_dir / "images"
-        if images_dst.exists():
-            shutil.rmtree(images_dst)
-        shutil.copytree(images_src, images_dst)
+    return n_images
 
 
 def main() -> int:
@@ -85,24 +130,16 @@ def main() -> int:
         kmz_path = assets_dir / "latest.kmz"
         try:
             print(f"Downloading KMZ: {args.url}")
-            download_file(args.url, kmz_path, timeout=args.timeout)
+            download_file(make_session(), args.url, kmz_path, timeout=args.timeout)
         except Exception as e:
             print(f"ERROR: download failed: {e}")
             return 2
 
-    # Extract to temp folder
-    tmp_dir = assets_dir / "_tmp_kmz_extract"
-    if tmp_dir.exists():
-        shutil.rmtree(tmp_dir)
-
     try:
         print(f"Extracting: {kmz_path}")
-        extract_kmz(kmz_path, tmp_dir)
+        n_images = extract_selected(kmz_path, assets_dir)
 
-        print("Collecting artifacts")
-        move_artifacts(tmp_dir, assets_dir)
-
-        print("Done. Updated assets/doc.kml and assets/images/")
+        print(f"Done. Updated assets/doc.kml and assets/images/ ({n_images} images)")
         return 0
     except zipfile.BadZipFile:
         print("ERROR: KMZ is not a valid zip archive (corrupted file).")
@@ -110,9 +147,6 @@ def main() -> int:
     except Exception as e:
         print(f"ERROR: extraction failed: {e}")
         return 2
-    finally:
-        if tmp_dir.exists():
-            shutil.rmtree(tmp_dir)
 
 
 if __name__ == "__main__":
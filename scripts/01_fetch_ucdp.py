@@ -6,20 +6,36 @@ Default:
   - Countries: Ukraine (369), Russia (365)
   - StartDate: 2022-02-24
 Outputs:
-  - data/raw/ucdp_events_ukr_ru.json
+  - data/raw/ucdp_events_ukr_ru.ndjson      (one event per line)
+  - data/raw/ucdp_events_ukr_ru.meta.json   (query, count, download time)
+
+Pages are written to disk as they arrive, so the full event list is never held
+in memory. If the output already exists, only events from its latest date_start
+onward are fetched and merged in by id (use --full to re-download everything).
 """
 
 from __future__ import annotations
 
 import argparse
 import json
-import time
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Set
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
 import requests
 
+from http_session import make_session
+
+# Optional: orjson for fast JSON (falls back to stdlib json)
+try:
+    import orjson
+    HAS_ORJSON = True
+except Exception:
+    HAS_ORJSON = False
+
 
 BASE_URL = "https://ucdpapi.pcr.uu.se/api/gedevents/25.1"
 
@@ -32,68 +48,171 @@ def ensure_dir(p: Path) -> None:
     p.mkdir(parents=True, exist_ok=True)
 
 
-def request_json(url: str, params: Optional[Dict[str, Any]] = None, timeout: int = 30, retries: int = 3) -> Dict[str, Any]:
-    last_err: Optional[Exception] = None
-    for attempt in range(1, retries + 1):
-        try:
-            r = requests.get(url, params=params, timeout=timeout)
-            r.raise_for_status()
-            return r.json()
-        except Exception as e:
-            last_err = e
-            if attempt < retries:
-                time.sleep(1.0 * attempt)
-            else:
-                raise
-    raise last_err  # for type checkers
+def write_json(path: Path, obj: Any, pretty: bool = False) -> None:
+    if HAS_ORJSON:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        path.write_bytes(orjson.dumps(obj, option=option))
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        if pretty:
+            json.dump(obj, f, ensure_ascii=False, indent=2)
+        else:
+            json.dump(obj, f, ensure_ascii=False, separators=(",", ":"))
+
+
+def dumps_line(obj: Any) -> bytes:
+    if HAS_ORJSON:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def iter_ndjson(path: Path) -> Iterator[Dict[str, Any]]:
+    loads = orjson.loads if HAS_ORJSON else json.loads
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield loads(line)
+
+
+def meta_path_for(out_path: Path) -> Path:
+    return out_path.with_suffix(".meta.json")
+
+
+def request_json(session: requests.Session, url: str, params: Optional[Dict[str, Any]] = None, timeout: int = 30) -> Dict[str, Any]:
+    r = session.get(url, params=params, timeout=timeout)
+    r.raise_for_status()
+    return r.json()
+
+
+def with_page(url: str, page: int) -> str:
+    """Return url with its `page` query parameter replaced."""
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k.lower() != "page"]
+    query.append(("page", str(page)))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def page_of(url: str) -> Optional[int]:
+    for k, v in parse_qsl(urlsplit(url).query):
+        if k.lower() == "page":
+            try:
+                return int(v)
+            except ValueError:
+                return None
+    return None
 
 
 def fetch_ucdp_events(
+    session: requests.Session,
     countries: str,
     start_date: str,
+    on_page: Callable[[List[Dict[str, Any]]], None],
     pagesize: int = 1000,
-    sleep_s: float = 0.5,
+    workers: int = 4,
     timeout: int = 30,
 ) -> Dict[str, Any]:
+    """Fetch all pages, handing each page's events to on_page in page order. Returns metadata."""
     params = {
         "pagesize": pagesize,
         "Country": countries,
         "StartDate": start_date,
     }
 
-    all_events: List[Dict[str, Any]] = []
-    next_url: Optional[str] = BASE_URL
-    page_num = 1
-    total_pages: Any = None
+    # Page 1 tells us TotalPages and how the API numbers its pages.
+    data = request_json(session, BASE_URL, params=params, timeout=timeout)
+    events = data.get("Result", []) or []
+    on_page(events)
+    collected = len(events)
+    total_pages: Any = data.get("TotalPages")
+    next_url: Optional[str] = data.get("NextPageUrl")
+    print(f"page=1 events={len(events)} total_collected={collected} total_pages={total_pages}")
 
-    while next_url:
-        if page_num == 1:
-            data = request_json(next_url, params=params, timeout=timeout)
-        else:
-            data = request_json(next_url, params=None, timeout=timeout)
+    next_page = page_of(next_url) if next_url else None
+    if next_url and isinstance(total_pages, int) and next_page is not None:
+        # Remaining pages are independent: fetch them concurrently, keep page order.
+        urls = [with_page(next_url, next_page + i) for i in range(total_pages - 1)]
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = [pool.submit(request_json, session, u, None, timeout) for u in urls]
+            for page_num, fut in enumerate(futures, start=2):
+                events = fut.result().get("Result", []) or []
+                on_page(events)
+                collected += len(events)
+                print(f"page={page_num} events={len(events)} total_collected={collected} total_pages={total_pages}")
+    else:
+        # Unknown page layout: walk NextPageUrl sequentially.
+        page_num = 2
+        while next_url:
+            data = request_json(session, next_url, params=None, timeout=timeout)
+            events = data.get("Result", []) or []
+            on_page(events)
+            collected += len(events)
+            total_pages = data.get("TotalPages", total_pages)
+            next_url = data.get("NextPageUrl")
+            print(f"page={page_num} events={len(events)} total_collected={collected} total_pages={total_pages}")
+            page_num += 1
 
-        events = data.get("Result", []) or []
-        all_events.extend(events)
+    return {
+        "source": "UCDP GED API v25.1",
+        "downloaded_at_utc": utc_now_str(),
+        "query": params,
+        "count": collected,
+        "total_pages": total_pages,
+    }
 
-        total_pages = data.get("TotalPages", total_pages)
-        next_url = data.get("NextPageUrl")
 
-        print(f"page={page_num} events={len(events)} total_collected={len(all_events)} total_pages={total_pages}")
-        page_num += 1
+class PageWriter:
+    """on_page sink: appends each event as one NDJSON line and remembers its id."""
 
-        if next_url:
-            time.sleep(sleep_s)
+    def __init__(self, f: BinaryIO) -> None:
+        self.f = f
+        self.ids: Set[Any] = set()
 
-    return {
-        "metadata": {
-            "source": "UCDP GED API v25.1",
-            "downloaded_at_utc": utc_now_str(),
-            "query": params,
-            "count": len(all_events),
-            "total_pages": total_pages,
-        },
-        "events": all_events,
-    }
+    def __call__(self, events: List[Dict[str, Any]]) -> None:
+        for e in events:
+            self.ids.add(e.get("id"))
+            self.f.write(dumps_line(e))
+
+
+def last_event_date(path: Path) -> Optional[str]:
+    """Latest date_start (YYYY-MM-DD) in an NDJSON event file, or None."""
+    dates = (str(e.get("date_start") or "")[:10] for e in iter_ndjson(path))
+    return max((d for d in dates if d), default=None)
+
+
+def copy_older_events(src: Path, dst: BinaryIO, before: str, skip_ids: Set[Any]) -> int:
+    """Copy events dated before `before` whose id was not re-fetched. Returns the number copied."""
+    loads = orjson.loads if HAS_ORJSON else json.loads
+    n = 0
+    with open(src, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            e = loads(line)
+            if str(e.get("date_start") or "")[:10] < before and e.get("id") not in skip_ids:
+                dst.write(line if line.endswith(b"\n") else line + b"\n")
+                n += 1
+    return n
+
+
+def read_meta(out_path: Path) -> Dict[str, Any]:
+    meta_path = meta_path_for(out_path)
+    if not meta_path.exists():
+        return {}
+    loads = orjson.loads if HAS_ORJSON else json.loads
+    return loads(meta_path.read_bytes())
+
+
+def resume_date(out_path: Path, query: Dict[str, Any], countries: str, start_date: str) -> Optional[str]:
+    """
+    Date to resume out_path from, or None for a full fetch. Only resumes when the stored
+    query asked for the same countries and started no later than start_date.
+    """
+    stored_start = str(query.get("StartDate") or "")
+    if str(query.get("Country") or "") != countries or not stored_start or stored_start > start_date:
+        print("incremental: existing file was fetched for other countries or a later start, doing a full fetch")
+        return None
+    last = last_event_date(out_path)
+    return last if last and last > start_date else None
 
 
 def main() -> int:
@@ -101,30 +220,72 @@ def main() -> int:
     parser.add_argument("--countries", default="369,365", help="Comma-separated UCDP country codes (e.g., 369,365)")
     parser.add_argument("--start-date", default="2022-02-24", help="Start date YYYY-MM-DD")
     parser.add_argument("--pagesize", type=int, default=1000, help="API pagesize (max 1000)")
-    parser.add_argument("--sleep", type=float, default=0.5, help="Sleep between pages (seconds)")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent page requests after the first page")
     parser.add_argument("--timeout", type=int, default=30, help="Request timeout (seconds)")
-    parser.add_argument("--out", default="data/raw/ucdp_events_ukr_ru.json", help="Output JSON path")
+    parser.add_argument("--retries", type=int, default=3, help="HTTP retries per request")
+    parser.add_argument("--out", default="data/raw/ucdp_events_ukr_ru.ndjson", help="Output NDJSON path")
+    parser.add_argument("--full", action="store_true", help="Ignore the existing output and re-download everything")
+    parser.add_argument("--pretty", action="store_true", help="Indent the .meta.json (default: compact)")
     args = parser.parse_args()
 
     out_path = Path(args.out)
     ensure_dir(out_path.parent)
 
+    # Incremental mode: UCDP only grows forward, so resume from the latest date we have,
+    # as long as the existing file was fetched for the same countries and an earlier start.
+    start_date = args.start_date
+    query: Dict[str, Any] = {}
+    incremental = False
+    if out_path.exists() and not args.full:
+        try:
+            query = read_meta(out_path).get("query") or {}
+            last = resume_date(out_path, query, args.countries, args.start_date)
+        except Exception as e:
+            print(f"WARNING: cannot read existing {out_path}, doing a full fetch: {e}")
+            last = None
+        if last:
+            start_date = last
+            incremental = True
+            print(f"incremental: fetching from {start_date}")
+
+    # New pages go to a side file first; the existing output stays intact until the end.
+    part_path = out_path.with_name(out_path.name + ".part")
     try:
-        dataset = fetch_ucdp_events(
-            countries=args.countries,
-            start_date=args.start_date,
-            pagesize=args.pagesize,
-            sleep_s=args.sleep,
-            timeout=args.timeout,
-        )
+        with open(part_path, "wb") as f:
+            writer = PageWriter(f)
+            metadata = fetch_ucdp_events(
+                session=make_session(args.retries, pool=max(1, args.workers)),
+                countries=args.countries,
+                start_date=start_date,
+                on_page=writer,
+                pagesize=args.pagesize,
+                workers=args.workers,
+                timeout=args.timeout,
+            )
     except Exception as e:
+        part_path.unlink(missing_ok=True)
         print(f"ERROR: fetch failed: {e}")
         return 2
 
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(dataset, f, ensure_ascii=False, indent=2)
+    if incremental:
+        # Older events we keep, then the re-fetched window (fresh copies win on id).
+        tmp_path = out_path.with_name(out_path.name + ".tmp")
+        with open(tmp_path, "wb") as dst:
+            kept = copy_older_events(out_path, dst, start_date, writer.ids)
+            with open(part_path, "rb") as src:
+                shutil.copyfileobj(src, dst, length=1024 * 1024)
+        part_path.unlink()
+        tmp_path.replace(out_path)
+        metadata["count"] += kept
+        metadata["fetched_since"] = start_date
+        # The merged file still covers the stored query's range
+        metadata["query"]["StartDate"] = query["StartDate"]
+    else:
+        part_path.replace(out_path)
+
+    write_json(meta_path_for(out_path), metadata, pretty=args.pretty)
 
-    print(f"saved: {out_path} (events={dataset['metadata']['count']})")
+    print(f"saved: {out_path} (events={metadata['count']})")
     return 0
 
 
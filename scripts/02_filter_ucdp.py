@@ -3,10 +3,12 @@
 Filter UCDP GED events into a smaller, map-friendly JSON.
 
 Reads:
-  - data/raw/ucdp_events_ukr_ru.json
+  - data/raw/ucdp_events_ukr_ru.ndjson (+ .meta.json), or a legacy {"metadata", "events"} JSON
 
 Writes:
-  - data/processed/ucdp_events_filtered.json
+  - data/processed/ucdp_events_filtered.ndjson        (one kept event per line)
+  - data/processed/ucdp_events_filtered.summary.json  (metadata + filter summary)
+  or, with --legacy-json, a single data/processed/ucdp_events_filtered.json
 """
 
 from __future__ import annotations
@@ -17,7 +19,24 @@ import re
 from collections import Counter
 from datetime import datetime, date, timezone
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+# Optional: orjson for fast JSON (falls back to stdlib json)
+try:
+    import orjson
+    HAS_ORJSON = True
+except Exception:
+    HAS_ORJSON = False
+
+# Optional: ijson to stream events from disk instead of loading the whole file
+try:
+    import ijson
+    HAS_IJSON = True
+except Exception:
+    HAS_IJSON = False
+
+# Errors reading or parsing the input, reported as ERROR lines instead of tracebacks
+INPUT_ERRORS: Tuple[type, ...] = (OSError, ValueError) + ((ijson.JSONError,) if HAS_IJSON else ())
 
 
 def ensure_dir(p: Path) -> None:
@@ -28,6 +47,106 @@ def utc_now_str() -> str:
     return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
 
 
+def read_json(path: Path) -> Any:
+    if HAS_ORJSON:
+        return orjson.loads(path.read_bytes())
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def dumps(obj: Any, pretty: bool = False) -> bytes:
+    if HAS_ORJSON:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        return orjson.dumps(obj, option=option)
+    if pretty:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def load_input(in_path: Path) -> Tuple[Dict[str, Any], Iterable[Dict[str, Any]]]:
+    """
+    Return (metadata, events). NDJSON input (01_fetch_ucdp.py output) is streamed
+    line by line with metadata from the sibling .meta.json. For a single JSON
+    document, ijson streams the events when available; otherwise it is loaded.
+    """
+    if in_path.suffix == ".ndjson":
+        meta_path = in_path.with_suffix(".meta.json")
+        metadata = read_json(meta_path) if meta_path.exists() else {}
+        return metadata, iter_ndjson(in_path)
+
+    if HAS_IJSON:
+        # metadata is written before events, so this stops reading early
+        with open(in_path, "rb") as f:
+            metadata = next(ijson.items(f, "metadata", use_float=True), {})
+        if not has_events_array(in_path):
+            raise ValueError("input JSON must contain a top-level 'events' list")
+        return metadata, iter_events(in_path)
+
+    data = read_json(in_path)
+    events = data.get("events")
+    if not isinstance(events, list):
+        raise ValueError("input JSON must contain a top-level 'events' list")
+    return data.get("metadata", {}), events
+
+
+def iter_ndjson(in_path: Path) -> Iterator[Dict[str, Any]]:
+    loads = orjson.loads if HAS_ORJSON else json.loads
+    with open(in_path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield loads(line)
+
+
+def has_events_array(in_path: Path) -> bool:
+    """Stream parse events until the top-level 'events' array opens."""
+    with open(in_path, "rb") as f:
+        parser = ijson.parse(f)
+        if next(parser, (None, None, None))[1] != "start_map":
+            return False  # top-level list, scalar or empty file
+        for prefix, event, _ in parser:
+            if prefix == "events":
+                return event == "start_array"
+    return False
+
+
+def iter_events(in_path: Path) -> Iterator[Dict[str, Any]]:
+    with open(in_path, "rb") as f:
+        yield from ijson.items(f, "events.item", use_float=True)
+
+
+class JsonArrayWriter:
+    """List stand-in that streams appended items into an already opened JSON array."""
+
+    def __init__(self, f: BinaryIO) -> None:
+        self.f = f
+        self.count = 0
+
+    def append(self, obj: Any) -> None:
+        self.f.write(b"\n" if self.count == 0 else b",\n")
+        self.f.write(dumps(obj))
+        self.count += 1
+
+
+class NdjsonWriter:
+    """Same interface as JsonArrayWriter, one compact JSON object per line."""
+
+    def __init__(self, f: BinaryIO) -> None:
+        self.f = f
+        self.count = 0
+
+    def append(self, obj: Any) -> None:
+        self.f.write(dumps(obj))
+        self.f.write(b"\n")
+        self.count += 1
+
+
+EventWriter = Union[JsonArrayWriter, NdjsonWriter]
+
+
+def summary_path_for(out_path: Path) -> Path:
+    return out_path.with_suffix(".summary.json")
+
+
 def parse_date(s: str) -> Optional[date]:
     if not s:
         return None
@@ -38,35 +157,39 @@ def parse_date(s: str) -> Optional[date]:
 
 
 def safe_int(x: Any, default: int = 0) -> int:
+    if isinstance(x, int):
+        return x
+    if x is None:
+        return default
     try:
-        if x is None:
-            return default
         return int(x)
     except Exception:
         return default
 
 
-def normalize_text_fields(ev: Dict[str, Any]) -> str:
-    text_keys = [
-        "conflict_name",
-        "dyad_name",
-        "side_a",
-        "side_b",
-        "where_coordinates",
-        "adm_1",
-        "adm_2",
-        "location",
-        "source_headline",
-        "source_original",
-        "notes",
-        "summary",
-    ]
-    parts: List[str] = []
-    for k in text_keys:
-        v = ev.get(k)
-        if isinstance(v, str) and v.strip():
-            parts.append(v.strip())
-    return " | ".join(parts).lower()
+TEXT_KEYS = (
+    "conflict_name",
+    "dyad_name",
+    "side_a",
+    "side_b",
+    "where_coordinates",
+    "adm_1",
+    "adm_2",
+    "location",
+    "source_headline",
+    "source_original",
+    "notes",
+    "summary",
+)
+
+
+def iter_text_fields(ev: Dict[str, Any]) -> Iterator[str]:
+    """Yield the non-empty text fields of an event, one at a time (no joined blob)."""
+    get = ev.get
+    for k in TEXT_KEYS:
+        v = get(k)
+        if isinstance(v, str) and v:
+            yield v
 
 
 def event_in_date_range(ev: Dict[str, Any], start: Optional[date], end: Optional[date]) -> bool:
@@ -109,32 +232,48 @@ def matches_min_best(ev: Dict[str, Any], min_best: Optional[int]) -> bool:
     return safe_int(ev.get("best"), default=0) >= min_best
 
 
-def matches_exclude_keywords(ev: Dict[str, Any], exclude_keywords: List[str]) -> bool:
-    if not exclude_keywords:
+def compile_keywords(keywords: List[str]) -> Optional[re.Pattern]:
+    """One case-insensitive alternation for all keywords: a single scan per text, however many keywords."""
+    alts = [re.escape(kw) for kw in keywords if kw]
+    if not alts:
+        return None
+    return re.compile("|".join(alts), re.IGNORECASE)
+
+
+def matches_exclude_keywords(ev: Dict[str, Any], exclude_regex: Optional[re.Pattern]) -> bool:
+    if not exclude_regex:
         return True
-    blob = normalize_text_fields(ev)
-    for kw in exclude_keywords:
-        if kw and kw.lower() in blob:
+    search = exclude_regex.search
+    for text in iter_text_fields(ev):
+        if search(text):
             return False
     return True
 
 
 def filter_events(
-    events: List[Dict[str, Any]],
+    events: Iterable[Dict[str, Any]],
+    kept: EventWriter,
     conflict_pattern: Optional[str],
     allowed_types: Optional[List[int]],
     start: Optional[date],
     end: Optional[date],
     min_best: Optional[int],
     exclude_keywords: List[str],
-) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+) -> Dict[str, Any]:
     conflict_regex = re.compile(conflict_pattern, re.IGNORECASE) if conflict_pattern else None
     allowed_set = set(allowed_types) if allowed_types else None
+    exclude_regex = compile_keywords(exclude_keywords)
 
-    kept: List[Dict[str, Any]] = []
+    input_events = 0
     dropped_reasons: Counter[str] = Counter()
 
+    # Aggregates for kept events are accumulated in the same pass as filtering.
+    type_counts: Counter[int] = Counter()
+    best_total = deaths_civilians_total = deaths_a_total = deaths_b_total = 0
+    _safe_int = safe_int
+
     for ev in events:
+        input_events += 1
         if not matches_conflict(ev, conflict_regex):
             dropped_reasons["conflict_mismatch"] += 1
             continue
@@ -147,23 +286,29 @@ def filter_events(
         if not matches_min_best(ev, min_best):
             dropped_reasons["below_min_best"] += 1
             continue
-        if not matches_exclude_keywords(ev, exclude_keywords):
+        if not matches_exclude_keywords(ev, exclude_regex):
             dropped_reasons["excluded_by_keyword"] += 1
             continue
         kept.append(ev)
 
-    type_counts = Counter(safe_int(e.get("type_of_violence"), -1) for e in kept)
+        get = ev.get
+        type_counts[_safe_int(get("type_of_violence"), -1)] += 1
+        best_total += _safe_int(get("best"), 0)
+        deaths_civilians_total += _safe_int(get("deaths_civilians"), 0)
+        deaths_a_total += _safe_int(get("deaths_a"), 0)
+        deaths_b_total += _safe_int(get("deaths_b"), 0)
+
     totals = {
-        "best_total": sum(safe_int(e.get("best"), 0) for e in kept),
-        "deaths_civilians_total": sum(safe_int(e.get("deaths_civilians"), 0) for e in kept),
-        "deaths_a_total": sum(safe_int(e.get("deaths_a"), 0) for e in kept),
-        "deaths_b_total": sum(safe_int(e.get("deaths_b"), 0) for e in kept),
+        "best_total": best_total,
+        "deaths_civilians_total": deaths_civilians_total,
+        "deaths_a_total": deaths_a_total,
+        "deaths_b_total": deaths_b_total,
     }
 
     summary = {
-        "input_events": len(events),
-        "kept_events": len(kept),
-        "dropped_events": len(events) - len(kept),
+        "input_events": input_events,
+        "kept_events": kept.count,
+        "dropped_events": input_events - kept.count,
         "dropped_by_reason": dict(dropped_reasons),
         "kept_type_of_violence_counts": dict(type_counts),
         "kept_totals": totals,
@@ -176,13 +321,18 @@ def filter_events(
             "exclude_keywords": exclude_keywords,
         },
     }
-    return kept, summary
+    return summary
 
 
 def main() -> int:
     ap = argparse.ArgumentParser(description="Filter UCDP events into a smaller JSON for mapping.")
-    ap.add_argument("-i", "--input", default="data/raw/ucdp_events_ukr_ru.json", help="Input JSON path")
-    ap.add_argument("-o", "--output", default="data/processed/ucdp_events_filtered.json", help="Output JSON path")
+    ap.add_argument("-i", "--input", default="data/raw/ucdp_events_ukr_ru.ndjson", help="Input NDJSON (or legacy JSON) path")
+    ap.add_argument(
+        "-o", "--output", default=None,
+        help="Output path (default: data/processed/ucdp_events_filtered.ndjson, or .json with --legacy-json)",
+    )
+    ap.add_argument("--legacy-json", action="store_true", help="Write one {metadata, summary, events} JSON instead of NDJSON")
+    ap.add_argument("--pretty", action="store_true", help="Indent the summary (default: compact; events stay one per line)")
 
     ap.add_argument("--conflict", default=r"Russia\s*-\s*Ukraine", help="Regex applied to conflict_name")
     ap.add_argument("--types", default="1,3", help="Allowed type_of_violence comma list. Empty = no filter.")
@@ -206,19 +356,23 @@ def main() -> int:
     exclude_keywords = [x.strip() for x in args.exclude.split(",") if x.strip()]
 
     in_path = Path(args.input)
-    out_path = Path(args.output)
+    if args.output:
+        out_path = Path(args.output)
+    else:
+        out_path = Path("data/processed/ucdp_events_filtered." + ("json" if args.legacy_json else "ndjson"))
     ensure_dir(out_path.parent)
 
-    with open(in_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    if not in_path.exists():
+        print(f"ERROR: input not found: {in_path}")
+        return 2
 
-    events = data.get("events")
-    if not isinstance(events, list):
-        print("ERROR: input JSON must contain a top-level 'events' list")
+    try:
+        metadata, events = load_input(in_path)
+    except INPUT_ERRORS as e:
+        print(f"ERROR: {e}")
         return 2
 
-    kept, summary = filter_events(
-        events=events,
+    filter_args = dict(
         conflict_pattern=args.conflict if args.conflict else None,
         allowed_types=types_list if types_list else None,
         start=start_d,
@@ -227,15 +381,26 @@ def main() -> int:
         exclude_keywords=exclude_keywords,
     )
 
-    out = {
-        "metadata": data.get("metadata", {}),
-        "generated_at_utc": utc_now_str(),
-        "summary": summary,
-        "events": kept,
-    }
+    # Written next to the output and swapped in only once filtering succeeded
+    tmp_path = out_path.with_name(out_path.name + ".tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            if args.legacy_json:
+                # Kept events are streamed straight into the output array; summary goes last.
+                f.write(b'{\n"metadata": ' + dumps(metadata) + b',\n"generated_at_utc": ' + dumps(utc_now_str()) + b',\n"events": [')
+                summary = filter_events(events=events, kept=JsonArrayWriter(f), **filter_args)
+                f.write(b'\n],\n"summary": ' + dumps(summary, pretty=args.pretty) + b"\n}\n")
+            else:
+                summary = filter_events(events=events, kept=NdjsonWriter(f), **filter_args)
+    except INPUT_ERRORS as e:
+        tmp_path.unlink(missing_ok=True)
+        print(f"ERROR: {e}")
+        return 2
+    tmp_path.replace(out_path)
 
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(out, f, ensure_ascii=False, indent=2)
+    if not args.legacy_json:
+        side = {"metadata": metadata, "generated_at_utc": utc_now_str(), "summary": summary}
+        summary_path_for(out_path).write_bytes(dumps(side, pretty=args.pretty))
 
     print(
         f"done input={summary['input_events']} kept={summary['kept_events']} "
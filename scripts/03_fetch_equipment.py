@@ -4,6 +4,8 @@ Fetch and parse equipment loss summaries (Oryx pages) and personnel counters.
 
 Outputs:
   - data/processed/war_stats.json
+Cache:
+  - data/cache/  (last body + ETag/Last-Modified per URL, for conditional GETs)
 
 Notes:
   - Oryx is an open-source intelligence blog. HTML structure may change.
@@ -13,15 +15,18 @@ Notes:
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
 import re
-import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any, Dict, Optional
 
 import requests
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
+
+from http_session import make_session
 
 
 URL_ORYX_RU = "https://www.oryxspioenkop.com/2022/02/attack-on-europe-documenting-equipment.html"
@@ -46,6 +51,7 @@ STATUS_MULTIPLIER = {
     "abandoned": 0.75,
     "captured": 0.65,
 }
+STATUS_WEIGHTS = tuple(STATUS_MULTIPLIER.items())
 
 PRICE_USD = {
     "Tanks": 3_000_000,
@@ -80,10 +86,13 @@ DEFAULT_PRICE_USD = 250_000
 
 HEADER_RE = re.compile(
     r"^(?P<cat>.+?)\s*\((?P<total>[\d,]+),\s*of which\s*(?P<rest>.+)\)\s*$",
-    re.IGNORECASE,
+    re.IGNORECASE | re.MULTILINE,
 )
 PAIR_RE = re.compile(r"(destroyed|damaged|abandoned|captured)\s*:\s*([\d,]+)", re.IGNORECASE)
 
+PEOPLE_RE = re.compile(r"(\d[\d,\. ]*)\s*people", re.IGNORECASE)
+TOTAL_RE = re.compile(r"total\s*[:\-]\s*(\d[\d,\. ]*)", re.IGNORECASE)
+
 
 def ensure_dir(p: Path) -> None:
     p.mkdir(parents=True, exist_ok=True)
@@ -93,58 +102,120 @@ def utc_now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
-def request_text(url: str, headers: Dict[str, str], timeout: int, retries: int) -> str:
-    last_err: Optional[Exception] = None
-    for attempt in range(1, retries + 1):
-        try:
-            r = requests.get(url, headers=headers, timeout=timeout)
-            r.raise_for_status()
-            return r.text
-        except Exception as e:
-            last_err = e
-            if attempt < retries:
-                time.sleep(1.0 * attempt)
-            else:
-                raise
-    raise last_err  # pragma: no cover
-
-
-def request_json(url: str, headers: Dict[str, str], timeout: int, retries: int) -> Any:
-    last_err: Optional[Exception] = None
-    for attempt in range(1, retries + 1):
-        try:
-            r = requests.get(url, headers=headers, timeout=timeout)
-            r.raise_for_status()
-            return r.json()
-        except Exception as e:
-            last_err = e
-            if attempt < retries:
-                time.sleep(1.0 * attempt)
-            else:
-                raise
-    raise last_err  # pragma: no cover
+def request_text(session: requests.Session, url: str, timeout: int, cache_dir: Optional[Path] = None) -> str:
+    """
+    GET url as text. With cache_dir, the last body and its ETag/Last-Modified are kept
+    on disk and sent back as If-None-Match/If-Modified-Since; a 304 reuses the body.
+    """
+    if cache_dir is None:
+        r = session.get(url, timeout=timeout)
+        r.raise_for_status()
+        return r.text
 
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    body_path = cache_dir / f"{key}.body"
+    meta_path = cache_dir / f"{key}.meta.json"
 
-def parse_oryx_categories(html: str) -> Dict[str, Dict[str, int]]:
-    soup = BeautifulSoup(html, "lxml")
+    headers: Dict[str, str] = {}
+    if body_path.exists() and meta_path.exists():
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        except Exception:
+            meta = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    r = session.get(url, timeout=timeout, headers=headers)
+    if r.status_code == 304 and headers:
+        print(f"cache: not modified {url}")
+        return body_path.read_text(encoding="utf-8")
+    r.raise_for_status()
+
+    text = r.text
+    etag = r.headers.get("ETag")
+    last_modified = r.headers.get("Last-Modified")
+    if etag or last_modified:
+        ensure_dir(cache_dir)
+        body_path.write_text(text, encoding="utf-8")
+        meta_path.write_text(
+            json.dumps({"url": url, "etag": etag, "last_modified": last_modified}), encoding="utf-8"
+        )
+    return text
+
+
+def request_json(session: requests.Session, url: str, timeout: int, cache_dir: Optional[Path] = None) -> Any:
+    return json.loads(request_text(session, url, timeout=timeout, cache_dir=cache_dir))
+
+
+def last_object(text: str) -> Optional[Dict[str, Any]]:
+    """Parse the last flat {...} object in a (possibly truncated) JSON array tail."""
+    end = text.rfind("}")
+    start = text.rfind("{", 0, end)
+    if start < 0 or end < 0:
+        return None
+    try:
+        obj = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+    return obj if isinstance(obj, dict) else None
+
+
+def request_last_record(
+    session: requests.Session, url: str, timeout: int, cache_dir: Optional[Path] = None, tail_bytes: int = 16384
+) -> Dict[str, Any]:
+    """
+    Last element of a JSON array of flat records, fetching only the file's tail via a
+    suffix Range request. With cache_dir the record and ETag are kept, so an unchanged
+    file costs a single 304.
+    """
+    cache_path = cache_dir / f"{hashlib.sha1(url.encode('utf-8')).hexdigest()}.last.json" if cache_dir else None
+    cached: Dict[str, Any] = {}
+    if cache_path and cache_path.exists():
+        try:
+            cached = json.loads(cache_path.read_text(encoding="utf-8"))
+        except Exception:
+            cached = {}
+
+    # identity: a byte range of a gzip-encoded body would not be decodable JSON text
+    headers = {"Range": f"bytes=-{tail_bytes}", "Accept-Encoding": "identity"}
+    if cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+
+    r = session.get(url, timeout=timeout, headers=headers)
+    if r.status_code == 304 and cached.get("record") is not None:
+        print(f"cache: not modified {url}")
+        return cached["record"]
+    r.raise_for_status()
+
+    record: Optional[Dict[str, Any]] = None
+    if r.status_code == 206:
+        record = last_object(r.text)
+    if record is None:
+        # Server ignored the Range (200) or the tail was not parseable: use the full document.
+        data = r.json() if r.status_code == 200 else request_json(session, url, timeout=timeout)
+        record = data[-1] if isinstance(data, list) and data and isinstance(data[-1], dict) else {}
+
+    etag = r.headers.get("ETag")
+    if cache_path and etag:
+        ensure_dir(cache_path.parent)
+        cache_path.write_text(json.dumps({"url": url, "etag": etag, "record": record}), encoding="utf-8")
+    return record
+
+
+def page_text(tree: LexborHTMLParser, separator: str) -> str:
+    node = tree.body or tree.root
+    return node.text(deep=True, separator=separator, strip=True) if node else ""
+
+
+def scan_headers(text: str) -> Dict[str, Dict[str, int]]:
+    """One regex pass over newline-separated text; every matching line is a category header."""
     out: Dict[str, Dict[str, int]] = {}
-
-    for h in soup.find_all(["h2", "h3"]):
-        t = h.get_text(" ", strip=True)
-        if not t:
-            continue
-        if "of which" not in t.lower() or "(" not in t:
-            continue
-
-        m = HEADER_RE.match(t)
-        if not m:
-            continue
-
+    for m in HEADER_RE.finditer(text):
         cat = m.group("cat").strip()
         total = int(m.group("total").replace(",", ""))
-        rest = m.group("rest")
-        pairs = {k.lower(): int(v.replace(",", "")) for k, v in PAIR_RE.findall(rest)}
-
+        pairs = {k.lower(): int(v.replace(",", "")) for k, v in PAIR_RE.findall(m.group("rest"))}
         out[cat] = {
             "total": total,
             "destroyed": pairs.get("destroyed", 0),
@@ -152,27 +223,20 @@ def parse_oryx_categories(html: str) -> Dict[str, Dict[str, int]]:
             "abandoned": pairs.get("abandoned", 0),
             "captured": pairs.get("captured", 0),
         }
+    return out
+
+
+def parse_oryx_categories(html: str) -> Dict[str, Dict[str, int]]:
+    tree = LexborHTMLParser(html)
+
+    # Category headers live in h2/h3; list items use the same "(n, of which ...)" shape
+    # for individual models, so only heading text is scanned first.
+    headings = "\n".join(h.text(deep=True, separator=" ", strip=True) for h in tree.css("h2, h3"))
+    out = scan_headers(headings)
 
     # fallback: try scanning full text if headings change
     if not out:
-        text = soup.get_text("\n", strip=True)
-        for line in text.splitlines():
-            if "of which" not in line.lower():
-                continue
-            m = HEADER_RE.match(line.strip())
-            if not m:
-                continue
-            cat = m.group("cat").strip()
-            total = int(m.group("total").replace(",", ""))
-            rest = m.group("rest")
-            pairs = {k.lower(): int(v.replace(",", "")) for k, v in PAIR_RE.findall(rest)}
-            out[cat] = {
-                "total": total,
-                "destroyed": pairs.get("destroyed", 0),
-                "damaged": pairs.get("damaged", 0),
-                "abandoned": pairs.get("abandoned", 0),
-                "captured": pairs.get("captured", 0),
-            }
+        out = scan_headers(page_text(tree, "\n"))
 
     return out
 
@@ -183,9 +247,12 @@ def money_score(categories: Dict[str, Dict[str, int]]) -> Dict[str, Any]:
 
     for cat, d in categories.items():
         unit_price = PRICE_USD.get(cat, DEFAULT_PRICE_USD)
+        get = d.get
+        # Same evaluation order as count * price * multiplier, so the floats round identically
+        # (no sum(): it uses compensated summation on Python 3.12+)
         usd = 0.0
-        for status in ("destroyed", "damaged", "abandoned", "captured"):
-            usd += d.get(status, 0) * unit_price * STATUS_MULTIPLIER[status]
+        for status, w in STATUS_WEIGHTS:
+            usd += get(status, 0) * unit_price * w
 
         enriched[cat] = {**d, "unit_price_usd": unit_price, "usd_estimated": int(usd)}
         total_usd += usd
@@ -197,9 +264,10 @@ def money_score(categories: Dict[str, Dict[str, int]]) -> Dict[str, Any]:
     }
 
 
-def get_live_ru_personnel_from_dataset(headers: Dict[str, str], timeout: int, retries: int) -> Dict[str, Any]:
-    data = request_json(URL_RU_JSON_PERSONNEL, headers=headers, timeout=timeout, retries=retries)
-    last = data[-1] if isinstance(data, list) and data else {}
+def get_live_ru_personnel_from_dataset(
+    session: requests.Session, timeout: int, cache_dir: Optional[Path] = None
+) -> Dict[str, Any]:
+    last = request_last_record(session, URL_RU_JSON_PERSONNEL, timeout=timeout, cache_dir=cache_dir)
     return {
         "day": last.get("day"),
         "date": last.get("date"),
@@ -208,22 +276,22 @@ def get_live_ru_personnel_from_dataset(headers: Dict[str, str], timeout: int, re
     }
 
 
-def get_live_ua_personnel_ualosses(headers: Dict[str, str], timeout: int, retries: int) -> Optional[int]:
+def get_live_ua_personnel_ualosses(
+    session: requests.Session, timeout: int, cache_dir: Optional[Path] = None
+) -> Optional[int]:
     try:
-        html = request_text(URL_UA_LOSSES_SOLDIERS, headers=headers, timeout=timeout, retries=retries)
-        soup = BeautifulSoup(html, "lxml")
-        text = soup.get_text(" ", strip=True)
+        html = request_text(session, URL_UA_LOSSES_SOLDIERS, timeout=timeout, cache_dir=cache_dir)
+        text = page_text(LexborHTMLParser(html), " ")
 
-        m = re.search(r"(\d[\d,\. ]*)\s*people", text, re.IGNORECASE)
-        if m:
-            return int(re.sub(r"[^\d]", "", m.group(1)))
-
-        m = re.search(r"total\s*[:\-]\s*(\d[\d,\. ]*)", text, re.IGNORECASE)
-        if m:
-            return int(re.sub(r"[^\d]", "", m.group(1)))
+        for rx in (PEOPLE_RE, TOTAL_RE):
+            m = rx.search(text)
+            if m:
+                return int(re.sub(r"[^\d]", "", m.group(1)))
 
+        print(f"Warning: no personnel counter found on {URL_UA_LOSSES_SOLDIERS}")
         return None
-    except Exception:
+    except Exception as e:
+        print(f"Warning: ualosses fetch failed: {e}")
         return None
 
 
@@ -232,34 +300,39 @@ def main() -> int:
     ap.add_argument("--out", default="data/processed/war_stats.json", help="Output JSON path")
     ap.add_argument("--timeout", type=int, default=25, help="HTTP timeout seconds")
     ap.add_argument("--retries", type=int, default=3, help="HTTP retries")
-    ap.add_argument("--sleep", type=float, default=0.8, help="Sleep between Oryx requests (seconds)")
+    ap.add_argument("--cache-dir", default="data/cache", help="Conditional-GET cache directory")
+    ap.add_argument("--no-cache", action="store_true", help="Always download full responses")
+    ap.add_argument("--pretty", action="store_true", help="Indent the output JSON (default: compact)")
     args = ap.parse_args()
 
     out_path = Path(args.out)
     ensure_dir(out_path.parent)
 
-    headers = dict(DEFAULT_HEADERS)
-
-    # RU equipment
-    print("fetch: oryx_ru")
-    ru_html = request_text(URL_ORYX_RU, headers=headers, timeout=args.timeout, retries=args.retries)
-    ru_cats = parse_oryx_categories(ru_html)
-    ru_score = money_score(ru_cats)
+    session = make_session(args.retries)
+    session.headers.update(DEFAULT_HEADERS)
+    cache_dir = None if args.no_cache else Path(args.cache_dir)
+    req = {"session": session, "timeout": args.timeout, "cache_dir": cache_dir}
 
-    time.sleep(args.sleep)
+    # The four sources do not depend on each other, so fetch them concurrently:
+    # wall time is the slowest request, not the sum of all four.
+    print("fetch: oryx_ru, oryx_ua, ru_personnel_dataset, ua_personnel_ualosses")
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        f_ru_html = pool.submit(request_text, url=URL_ORYX_RU, **req)
+        f_ua_html = pool.submit(request_text, url=URL_ORYX_UA, **req)
+        f_ru_personnel = pool.submit(get_live_ru_personnel_from_dataset, **req)
+        f_ua_personnel = pool.submit(get_live_ua_personnel_ualosses, **req)
 
-    # UA equipment
-    print("fetch: oryx_ua")
-    ua_html = request_text(URL_ORYX_UA, headers=headers, timeout=args.timeout, retries=args.retries)
-    ua_cats = parse_oryx_categories(ua_html)
-    ua_score = money_score(ua_cats)
+        # RU equipment
+        ru_cats = parse_oryx_categories(f_ru_html.result())
+        ru_score = money_score(ru_cats)
 
-    # Personnel
-    print("fetch: ru_personnel_dataset")
-    ru_personnel = get_live_ru_personnel_from_dataset(headers=headers, timeout=args.timeout, retries=args.retries)
+        # UA equipment
+        ua_cats = parse_oryx_categories(f_ua_html.result())
+        ua_score = money_score(ua_cats)
 
-    print("fetch: ua_personnel_ualosses")
-    ua_personnel = get_live_ua_personnel_ualosses(headers=headers, timeout=args.timeout, retries=args.retries)
+        # Personnel
+        ru_personnel = f_ru_personnel.result()
+        ua_personnel = f_ua_personnel.result()
 
     payload = {
         "timestamp_utc": utc_now_iso(),
@@ -279,7 +352,10 @@ def main() -> int:
     }
 
     with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(payload, f, indent=2, ensure_ascii=False)
+        if args.pretty:
+            json.dump(payload, f, indent=2, ensure_ascii=False)
+        else:
+            json.dump(payload, f, separators=(",", ":"), ensure_ascii=False)
 
     print(f"saved: {out_path}")
     print(f"equipment_estimate_billion_usd ru={ru_score['total_billion_usd_estimated']} ua={ua_score['total_billion_usd_estimated']}")
@@ -12,21 +12,47 @@ Output:
 """
 # 10_build_map.py
 
+import base64
+import copy
+import gzip
+import io
+import json
 import os
+import re
+import sys
+from array import array
+from datetime import datetime, timezone
+from functools import lru_cache
+from types import SimpleNamespace
+
 import folium
-import xml.etree.ElementTree as ET
+import lxml.etree as LET
+from folium.utilities import image_to_url
+import numpy as np
+from jinja2 import Template
 
-# Optional: geopandas for Ukraine border
+# Optional: orjson for fast JSON (falls back to stdlib json)
 try:
-    import geopandas as gpd
-    HAS_GEOPANDAS = True
+    import orjson
+    HAS_ORJSON = True
 except Exception:
-    HAS_GEOPANDAS = False
+    HAS_ORJSON = False
 
 # --- CONFIG ---
 KML_FILE = os.path.join("assets", "doc.kml")
 IMAGES_FOLDER = os.path.join("assets", "images")
 OUTPUT_MAP = os.path.join("outputs", "index.html")
+# Also write OUTPUT_MAP + ".gz" (pre-compressed copy for servers that can send it with
+# Content-Encoding: gzip; GitHub Pages compresses on its own and does not need it)
+GZIP_OUTPUT = False
+# The embedded UCDP dataset is gzipped only when that shrinks it to at most this fraction
+# of its raw size; otherwise it ships as plain base64, which also decodes in browsers
+# without DecompressionStream. 0 never gzips it.
+UCDP_GZIP_MAX_RATIO = 0.8
+# Files copied from IMAGES_FOLDER next to the output map
+IMAGE_EXTS = frozenset({".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp", ".ico"})
+# Legend & Layers dock: dock.css / dock.html / dock.js with __PLACEHOLDER__ slots
+DOCK_ASSETS = os.path.join("assets", "dock")
 
 # Keep only "live-ish" relevant folders (name contains any of these tokens)
 # When True, process placemarks in all folders (useful for debugging / one-off runs)
@@ -73,8 +99,9 @@ COLORS = {
 }
 
 
+@lru_cache(maxsize=512)
 def hex_kml_to_html(kml_color: str) -> str:
-    """KML color = AABBGGRR -> HTML = #RRGGBB"""
+    """KML color = AABBGGRR -> HTML = #RRGGBB (memoized: a KML reuses a handful of colors)"""
     if not kml_color:
         return "#FF0000"
     clean = kml_color.strip().lstrip("#")
@@ -85,84 +112,213 @@ def hex_kml_to_html(kml_color: str) -> str:
     # BBGGRR -> RRGGBB
     return f"#{clean[4:6]}{clean[2:4]}{clean[0:2]}"
 
+@lru_cache(maxsize=None)
+def marker_icon_url(icon_path: str):
+    """
+    URL for a style icon: local images (assets/images/...) are read and base64-embedded,
+    http(s)/data:/absolute references are used as given. None if unusable. Memoized:
+    thousands of unit markers share a handful of icons.
+    """
+    if not icon_path:
+        return None
+    try:
+        if os.path.exists(icon_path) or icon_path.startswith(("http", "data:", "/")):
+            return image_to_url(icon_path)
+    except Exception as e:
+        print(f"Warning: failed to load icon {icon_path}: {e}")
+    return None
+
+def _any_token_re(tokens):
+    """One case-insensitive alternation: a single C-level scan instead of a loop of `in` tests."""
+    return re.compile("|".join(re.escape(t) for t in tokens), re.IGNORECASE)
+
+_RE_KEEP = _any_token_re(FOLDERS_TO_KEEP)
+_RE_BLACKLIST = _any_token_re(FOLDER_BLACKLIST_KEYWORDS)
+
 def is_blacklisted_folder(folder_name: str) -> bool:
-    ln = (folder_name or "").lower()
-    return any(k.lower() in ln for k in FOLDER_BLACKLIST_KEYWORDS)
+    return bool(_RE_BLACKLIST.search(folder_name or ""))
 
 def is_allowed_folder(folder_name: str) -> bool:
     if PROCESS_ALL_FOLDERS:
         return True
-    if not folder_name:
-        return False
-    if is_blacklisted_folder(folder_name):
-        return False
-    return any(token.lower() in folder_name.lower() for token in FOLDERS_TO_KEEP)
+    return bool(folder_name) and not _RE_BLACKLIST.search(folder_name) and bool(_RE_KEEP.search(folder_name))
 
-def parse_kml_styles(root, ns):
+@lru_cache(maxsize=None)
+def kml_xpaths(ns_url: str):
     """
-    Return:
+    Compiled XPaths for style parsing and interned geometry tags, one set per KML
+    namespace (2.2, 2.1, ...).
+    """
+    nsmap = {"kml": ns_url}
+    xp = lambda path: LET.XPath(path, namespaces=nsmap)
+    tag = lambda local: sys.intern(f"{{{ns_url}}}{local}" if ns_url else local)
+    return SimpleNamespace(
+        icon_href=xp("kml:IconStyle/kml:Icon/kml:href/text()"),
+        line_color=xp("kml:LineStyle/kml:color/text()"),
+        line_width=xp("kml:LineStyle/kml:width/text()"),
+        poly_color=xp("kml:PolyStyle/kml:color/text()"),
+        pairs=xp("kml:Pair"),
+        pair_key=xp("kml:key/text()"),
+        pair_url=xp("kml:styleUrl/text()"),
+        coords_tag=tag("coordinates"),
+        point_tag=tag("Point"),
+        line_tag=tag("LineString"),
+        poly_tag=tag("Polygon"),
+    )
+
+def placemark_geometry(pm, xp):
+    """
+    First <coordinates> element of each geometry kind in a placemark as (point, line, polygon),
+    None where absent: one walk over its coordinates instead of a subtree search per kind.
+    Polygon rings match at any depth under the Polygon (outerBoundaryIs/LinearRing/...).
+    """
+    point = line = poly = None
+    for coords in pm.iter(xp.coords_tag):
+        parent = coords.getparent()
+        if parent.tag == xp.point_tag:
+            if point is None:
+                point = coords
+                if coords.text:
+                    break  # a usable point wins over any line/polygon
+        elif parent.tag == xp.line_tag:
+            if line is None:
+                line = coords
+        elif poly is None:
+            anc = parent
+            while anc is not None and anc is not pm:
+                if anc.tag == xp.poly_tag:
+                    poly = coords
+                    break
+                anc = anc.getparent()
+    return point, line, poly
+
+def kml_namespace(kml_path) -> str:
+    """Namespace URL of the KML root element (read from the first start event only)."""
+    for _, el in LET.iterparse(kml_path, events=("start",)):
+        return el.tag.split("}")[0].strip("{") if el.tag.startswith("{") else ""
+    return ""
+
+def kml_path_latlon(text: str) -> list:
+    """[[lat, lon], ...] from a KML <coordinates> string ("lon,lat[,alt] lon,lat[,alt] ...")."""
+    tuples = text.split()
+    if not tuples:
+        return []
+    dim = tuples[0].count(",") + 1
+    # One C-level parse of every number, then take the lat/lon columns
+    arr = np.fromstring(text.replace(",", " "), sep=" ")
+    if arr.size != dim * len(tuples):
+        # tuples with and without altitude mixed in one path
+        return [[float(c.split(",")[1]), float(c.split(",")[0])] for c in tuples]
+    return arr.reshape(-1, dim)[:, 1::-1].tolist()
+
+def read_kml_style(el, xp, image_set, style_defs, style_maps):
+    """
+    Record one Style/StyleMap element into:
       style_defs: { "#styleId": {icon, color, fill, width} }
       style_maps: { "#styleMapId": "#resolvedStyleId" }
     """
-    style_defs = {}
-    style_maps = {}
-
-    # 1) Styles
-    for style in root.findall(".//kml:Style", ns):
-        s_id = style.get("id")
-        if not s_id:
-            continue
-
-        data = {"icon": None, "color": None, "fill": None, "width": None}
-
-        # Icon
-        icon_href = style.find(".//kml:Icon/kml:href", ns)
-        if icon_href is not None and icon_href.text:
-            fname = os.path.basename(icon_href.text.strip())
-            # Resolve to filesystem image path in assets/images so folium can read it
-            src_path = os.path.join(IMAGES_FOLDER, fname)
-            if os.path.exists(src_path):
-                data["icon"] = src_path
-
-        # Line style
-        line_color = style.find(".//kml:LineStyle/kml:color", ns)
-        if line_color is not None and line_color.text:
-            data["color"] = hex_kml_to_html(line_color.text)
-
-        line_width = style.find(".//kml:LineStyle/kml:width", ns)
-        if line_width is not None and line_width.text:
-            try:
-                data["width"] = float(line_width.text.strip())
-            except Exception:
-                pass
-
-        # Poly style
-        poly_color = style.find(".//kml:PolyStyle/kml:color", ns)
-        if poly_color is not None and poly_color.text:
-            data["fill"] = hex_kml_to_html(poly_color.text)
-
-        style_defs[f"#{s_id}"] = data
-
-    # 2) StyleMaps (UAControlMap uses these heavily)
-    for sm in root.findall(".//kml:StyleMap", ns):
-        sm_id = sm.get("id")
-        if not sm_id:
-            continue
-
+    if el.tag.endswith("StyleMap"):
+        # StyleMaps (UAControlMap uses these heavily)
+        sm_id = el.get("id")
         normal_pair = None
-        for pair in sm.findall(".//kml:Pair", ns):
-            key = pair.find("kml:key", ns)
-            url = pair.find("kml:styleUrl", ns)
-            if key is None or url is None or not url.text:
+        for pair in xp.pairs(el):
+            key = xp.pair_key(pair)
+            url = xp.pair_url(pair)
+            if not key or not url:
                 continue
-            if key.text.strip() == "normal":
-                normal_pair = url.text.strip()
+            if key[0].strip() == "normal":
+                normal_pair = url[0].strip()
                 break
 
-        if normal_pair:
+        if sm_id and normal_pair:
             style_maps[f"#{sm_id}"] = normal_pair
+        return
+
+    s_id = el.get("id")
+    if not s_id:
+        return
+    data = {"icon": None, "color": None, "fill": None, "width": None}
+
+    # Icon
+    icon_href = xp.icon_href(el)
+    if icon_href:
+        fname = os.path.basename(icon_href[0].strip())
+        # Resolve to filesystem image path in assets/images so folium can read it
+        if fname in image_set:
+            data["icon"] = os.path.join(IMAGES_FOLDER, fname)
+
+    # Line style
+    line_color = xp.line_color(el)
+    if line_color:
+        data["color"] = hex_kml_to_html(line_color[0])
+
+    line_width = xp.line_width(el)
+    if line_width:
+        try:
+            data["width"] = float(line_width[0].strip())
+        except Exception:
+            pass
+
+    # Poly style
+    poly_color = xp.poly_color(el)
+    if poly_color:
+        data["fill"] = hex_kml_to_html(poly_color[0])
+
+    style_defs[f"#{s_id}"] = data
+
+def iter_kml(kml_path, ns):
+    """
+    Single streaming pass over the KML (lxml iterparse, bounded memory).
+
+    Yields (element, folders, in_folder) in document order for every Style, StyleMap
+    and Placemark. `folders` is the tuple of enclosing Folder names walked from the
+    Document (outermost first); `in_folder` is True when the element is a direct child
+    of the innermost of them. Elements are cleared once the consumer moves on.
+    """
+    k = f"{{{ns['kml']}}}"
+    folder_tag, name_tag, doc_tag = f"{k}Folder", f"{k}name", f"{k}Document"
+    containers = (folder_tag, doc_tag)
+    tags = (folder_tag, name_tag, f"{k}Style", f"{k}StyleMap", f"{k}Placemark")
+
+    stack = []       # [element, name] per Folder reachable through Folders from the Document
+    folders = ()
+    root = None
+
+    for event, el in LET.iterparse(kml_path, events=("start", "end"), tag=tags):
+        if root is None:
+            root = el.getroottree().getroot()
+        parent = el.getparent()
+
+        if event == "start":
+            if el.tag == folder_tag:
+                top = stack[-1][0] if stack else None
+                if parent is not None and (
+                    parent is top or parent is root or (parent.tag == doc_tag and parent.getparent() is root)
+                ):
+                    stack.append([el, ""])
+                    folders = folders + ("",)
+            continue
 
-    return style_defs, style_maps
+        if el.tag == name_tag:
+            # Folder names are captured here, before pruning can drop the <name> element
+            if stack and parent is stack[-1][0] and not stack[-1][1]:
+                stack[-1][1] = (el.text or "").strip()
+                folders = folders[:-1] + (stack[-1][1],)
+            continue
+
+        if el.tag == folder_tag:
+            if stack and stack[-1][0] is el:
+                stack.pop()
+                folders = folders[:-1]
+        else:
+            yield el, folders, bool(stack) and parent is stack[-1][0]
+
+        # Drop what has been handled. Only siblings inside containers are pruned: a Style
+        # inside a StyleMap Pair or a Placemark still has siblings its parent must read.
+        el.clear(keep_tail=True)
+        if parent is not None and (parent.tag in containers or parent is root):
+            while el.getprevious() is not None:
+                del parent[0]
 
 def resolve_style(style_url: str, style_defs: dict, style_maps: dict):
     """Resolve #StyleMap -> #Style if needed"""
@@ -172,40 +328,65 @@ def resolve_style(style_url: str, style_defs: dict, style_maps: dict):
         style_url = style_maps[style_url]
     return style_defs.get(style_url)
 
-def classify_feature(folder_name: str, placemark_name: str) -> str:
-    """
-    Returns: 'historic' | 'ua' | 'ru' | 'other'
-    """
-    fn = (folder_name or "").lower()
-    nm = (placemark_name or "").lower()
+def _all_of(*alternatives):
+    """Regex that matches when every alternative group occurs somewhere in the text."""
+    return "".join(f"(?=.*(?:{alt}))" for alt in alternatives)
 
+_I = re.IGNORECASE | re.DOTALL
+
+def _rx(pattern):
+    return re.compile(pattern, _I) if pattern else None
+
+# (placemark-name pattern, folder-name pattern, kind); either pattern may match, first rule wins
+_CLASSIFY_RULES = [
     # Historic / initial invasion
-    if "initial invasion" in nm or "initial" in nm and "invasion" in nm:
-        return "historic"
-    if "kyiv axis" in nm and ("initial" in nm or "invasion" in nm):
-        return "historic"
-    if "2022" in nm and ("axis" in nm or "offensive" in nm):
-        return "historic"
+    (_rx(_all_of("initial", "invasion")), None, "historic"),
+    (_rx(_all_of("kyiv axis", "initial|invasion")), None, "historic"),
+    (_rx(_all_of("2022", "axis|offensive")), None, "historic"),
 
     # UA by name or folder
-    if "ukrainian" in nm or "ukrainian" in fn:
-        return "ua"
-    if "kherson counterattack" in nm or "counterattack" in nm and "ukrainian" in nm:
-        return "ua"
+    (_rx("ukrainian|kherson counterattack"), _rx("ukrainian"), "ua"),
 
     # RU by name or folder
-    if "russian" in nm or "russian" in fn:
-        return "ru"
-    if "important areas" in fn:
-        # usually occupied/controlled areas
-        return "ru"
+    (_rx("russian"), _rx("russian"), "ru"),
+    # usually occupied/controlled areas
+    (None, _rx("important areas"), "ru"),
+]
+
+def classify_feature(folder_name: str, placemark_name: str) -> str:
+    """
+    Returns: 'historic' | 'ua' | 'ru' | 'other'
+    """
+    nm = placemark_name or ""
+    fn = folder_name or ""
+
+    for name_rx, folder_rx, kind in _CLASSIFY_RULES:
+        if (name_rx and name_rx.search(nm)) or (folder_rx and folder_rx.search(fn)):
+            return kind
 
     return "other"
 
-def add_country_border(m: folium.Map, gdf, name_or_iso, color, weight, opacity, layer_name,
-                       fill=False, fill_color=None, fill_opacity=0.0, show=True, control=True):
-    fg = folium.FeatureGroup(name=layer_name, show=show, control=control).add_to(m)
+@lru_cache(maxsize=None)
+def folder_hints(folder_name: str):
+    """
+    (unit side, is frontline) from a folder name: 'ua' / 'ru' for the unit-position
+    folders (else None), and whether it is a frontline folder. Computed once per folder.
+    """
+    fn = (folder_name or "").lower()
+    if "ukrainian unit positions" in fn:
+        side = "ua"
+    elif "russian unit positions" in fn:
+        side = "ru"
+    else:
+        side = None
+    return side, "frontline" in fn
 
+def select_country(gdf, name_or_iso, simplify_tolerance=0.01):
+    """
+    Rows for one country (ISO A3 or name), reprojected to WGS84, geometry only and
+    simplified by simplify_tolerance degrees (0.01 ~ 1 km; None keeps full detail).
+    None if not found.
+    """
     cols = {c.lower(): c for c in gdf.columns}
     iso_col  = cols.get("iso_a3") or cols.get("adm0_a3") or cols.get("sov_a3")
     name_col = cols.get("admin") or cols.get("name") or cols.get("sovereignt")
@@ -216,22 +397,48 @@ def add_country_border(m: folium.Map, gdf, name_or_iso, color, weight, opacity,
     elif name_col:
         country = gdf[gdf[name_col].astype(str).str.lower().str.contains(str(name_or_iso).lower(), na=False)]
     else:
-        country = gdf[gdf.astype(str).apply(
-            lambda r: r.str.contains(str(name_or_iso), case=False, na=False).any(), axis=1
-        )]
+        # column-wise vectorized substring test instead of a Python lambda per row
+        mask = False
+        for col in gdf.columns.drop(gdf.geometry.name, errors="ignore"):
+            mask = mask | gdf[col].astype(str).str.contains(str(name_or_iso), case=False, na=False, regex=False)
+        country = gdf[mask]
 
     if country.empty:
         print(f"Warning: {name_or_iso} not found in shapefile. Columns: {list(gdf.columns)}")
         return None
 
-    # CRS to WGS84
+    # CRS to WGS84 (only the selected rows are reprojected)
     if country.crs is None:
         country = country.set_crs("EPSG:4326")
     else:
         country = country.to_crs("EPSG:4326")
 
+    # Attributes are never used by the border style; vertices below map resolution are dropped
+    country = country[[country.geometry.name]].copy()
+    if simplify_tolerance:
+        country[country.geometry.name] = country.geometry.simplify(simplify_tolerance, preserve_topology=True)
+    return country
+
+def add_country_border(m: folium.Map, gdf, name_or_iso, color, weight, opacity, layer_name,
+                       fill=False, fill_color=None, fill_opacity=0.0, show=True, control=True,
+                       country_gdf=None):
+    """Draw a country outline; pass country_gdf (from select_country) to reuse a selection."""
+    country = country_gdf if country_gdf is not None else select_country(gdf, name_or_iso)
+    if country is None:
+        return None
+
+    fg = folium.FeatureGroup(name=layer_name, show=show, control=control).add_to(m)
+
+    # GEOS writes the GeoJSON text (shapely 2) instead of __geo_interface__ building
+    # nested per-vertex dicts that are then dumped again
+    import shapely
+    features = ",".join(
+        f'{{"type":"Feature","properties":{{}},"geometry":{g}}}'
+        for g in shapely.to_geojson(country.geometry.values)
+    )
+
     folium.GeoJson(
-        country.__geo_interface__,
+        f'{{"type":"FeatureCollection","features":[{features}]}}',
         style_function=lambda feat: {
             "color": color,
             "weight": weight,
@@ -251,22 +458,39 @@ def add_borders_from_shp(m: folium.Map):
         print(f"Error: shapefile not found at {shp_path}")
         return None, None
 
-    if not HAS_GEOPANDAS:
+    # Optional: geopandas for the borders. Imported here so runs without a shapefile
+    # don't pay for the pyproj/shapely/GDAL start-up.
+    try:
+        import geopandas as gpd
+    except Exception:
         print("Error: geopandas not available. Install geopandas.")
         return None, None
 
-    import geopandas as gpd
-    gdf = gpd.read_file(shp_path)
+    gdf = None
+    try:
+        # pyogrio pushes the filter into OGR: only the two needed polygons are parsed
+        gdf = gpd.read_file(
+            shp_path, engine="pyogrio",
+            columns=["ADM0_A3"], where="ADM0_A3 IN ('UKR', 'RUS')",
+        )
+    except Exception:
+        gdf = None
+    if gdf is None or gdf.empty:
+        gdf = gpd.read_file(shp_path)
+
+    # Select + reproject each country once; the UA halo and border draws share it
+    ukr = select_country(gdf, "UKR")
+    rus = select_country(gdf, "RUS")
 
     # halo rings (not part of layer control)
     add_country_border(
-        m, gdf, "UKR",
+        m, gdf, "UKR", country_gdf=ukr,
         color="#111111", weight=5, opacity=0.85,
         layer_name="UA Border (halo)",
         fill=False, show=True, control=False
     )
     add_country_border(
-        m, gdf, "UKR",
+        m, gdf, "UKR", country_gdf=ukr,
         color="#000000", weight=7, opacity=0.65,
         layer_name="UA Border (halo)",
         fill=False, show=True, control=False
@@ -274,13 +498,13 @@ def add_borders_from_shp(m: folium.Map):
 
     # real borders (user-controllable)
     fg_ua_border = add_country_border(
-        m, gdf, "UKR",
+        m, gdf, "UKR", country_gdf=ukr,
         color=COLORS["ua_border"], weight=3.5, opacity=0.95,
         layer_name="UA Border", fill=False, show=True, control=True
     )
 
     fg_ru_border = add_country_border(
-        m, gdf, "RUS",
+        m, gdf, "RUS", country_gdf=rus,
         color=COLORS["ru_border"], weight=2.2, opacity=0.55,
         layer_name="Russia Border", fill=False, show=False, control=True
     )
@@ -288,7 +512,113 @@ def add_borders_from_shp(m: folium.Map):
     print("Added UA borders (and optional RU) from shapefile.")
     return fg_ua_border, fg_ru_border
 
-import folium
+class RawHtml(folium.Element):
+    """
+    Pre-built HTML spliced into the page verbatim. folium.Element compiles its string
+    as a Jinja template (megabytes for the UCDP payload, and any "{{" in the data
+    would be interpreted); this one is stored as-is and returned from render().
+    """
+
+    def __init__(self, html: str):
+        super().__init__()
+        self._name = "RawHtml"
+        self.html = html
+
+    def render(self, **kwargs) -> str:
+        return self.html
+
+class CircleMarkerBatch(folium.MacroElement):
+    """
+    Plain circle markers of one color, added to the parent FeatureGroup by a single JS loop
+    over [[lat, lon, name], ...] instead of one folium.CircleMarker (plus Popup and
+    Tooltip objects) per point. Markers, popups and tooltips match the folium ones.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var group = {{ this._parent.get_name() }};
+            {{ this.points_js }}.forEach(function(p) {
+                var marker = L.circleMarker([p[0], p[1]], {
+                    radius: 3, weight: 1, color: {{ this.color|tojson }},
+                    fill: true, fillColor: {{ this.color|tojson }}, fillOpacity: 0.9
+                });
+                marker.bindPopup('<div style="width: 100.0%; height: 100.0%;">' + p[2] + '</div>', {maxWidth: "100%"});
+                marker.bindTooltip('<div>' + p[2] + '</div>', {sticky: true});
+                marker.addTo(group);
+            });
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, points, color: str):
+        super().__init__()
+        self._name = "CircleMarkerBatch"
+        self.points_js = _js_json(points).replace("</", "<\\/")
+        self.color = color
+
+class ShapeBatch(folium.MacroElement):
+    """
+    KML lines and polygons for all FeatureGroups, created by one JS loop in document order
+    (the canvas draw order stays as before) instead of one folium.PolyLine / folium.Polygon
+    with its own template render per shape. Styles and group references are shared by index.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var groups = [{{ this.group_names|join(", ") }}];
+            var styles = {{ this.styles_js() }};
+            {{ this.items_js() }}.forEach(function(it) {
+                var shape = (it[0] ? L.polygon : L.polyline)(it[3], styles[it[2]]);
+                if (it.length > 4) {
+                    shape.bindPopup('<div style="width: 100.0%; height: 100.0%;">' + it[4] + '</div>', {maxWidth: "100%"});
+                    if (it[4]) shape.bindTooltip('<div>' + it[4] + '</div>', {sticky: true});
+                }
+                shape.addTo(groups[it[1]]);
+            });
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self):
+        super().__init__()
+        self._name = "ShapeBatch"
+        self.group_names = []
+        self.styles = []
+        self.items = []  # [is polygon, group index, style index, [[lat, lon], ...](, popup name)]
+        self._group_index = {}
+        self._style_index = {}
+
+    def add(self, path, group, style: dict, polygon=False, name=None):
+        g = self._group_index.get(group.get_name())
+        if g is None:
+            g = self._group_index[group.get_name()] = len(self.group_names)
+            self.group_names.append(group.get_name())
+        key = tuple(sorted(style.items()))
+        st = self._style_index.get(key)
+        if st is None:
+            st = self._style_index[key] = len(self.styles)
+            self.styles.append(style)
+        item = [1 if polygon else 0, g, st, path]
+        if name is not None:
+            item.append(name)
+        self.items.append(item)
+
+    def styles_js(self) -> str:
+        return _js_json(self.styles)
+
+    def items_js(self) -> str:
+        return _js_json(self.items).replace("</", "<\\/")
+
+@lru_cache(maxsize=None)
+def read_dock_assets():
+    """(css, html, js) of the Legend & Layers dock, read once from assets/dock.*"""
+    parts = []
+    for ext in ("css", "html", "js"):
+        with open(f"{DOCK_ASSETS}.{ext}", encoding="utf-8") as f:
+            parts.append(f.read())
+    return tuple(parts)
 
 def add_legend_and_layers(m, COLORS, layer_vars: dict):
     """
@@ -311,367 +641,210 @@ def add_legend_and_layers(m, COLORS, layer_vars: dict):
 
     layers_html = "\n".join(rows)
 
-    html = f"""
-    <style>
-      .dock-btn{{
-    cursor:pointer;
-    user-select:none;
-    padding: 4px 9px;
-    border-radius: 9px;
-    border: 1px solid rgba(255,255,255,0.14);
-    background: rgba(255,255,255,0.06);
-    font-weight: 900;
-    font-size: 12px;
-    opacity: .92;
-    transition: transform 90ms ease, opacity 140ms ease, background 140ms ease, box-shadow 140ms ease;
-    box-shadow: 0 6px 16px rgba(0,0,0,0.18);
-  }}
-  .dock-btn:hover{{
-    opacity: 1;
-    background: rgba(255,255,255,0.10);
-    box-shadow: 0 10px 22px rgba(0,0,0,0.30);
-  }}
-  .dock-btn:active{{
-    transform: translateY(1px);
-    opacity: .95;
-  }}
-  .dock-btn.dock-on{{
-    background: rgba(255,255,255,0.12);
-    box-shadow: 0 10px 26px rgba(0,0,0,0.35);
-  }}
-
-  .dock-pill{{
-    display:inline-block;
-    padding: 3px 8px;
-    border-radius: 999px;
-    border: 1px solid rgba(255,255,255,0.14);
-    background: rgba(255,255,255,0.06);
-    font-size: 11px;
-    font-weight: 900;
-    opacity:.88;
-    cursor:pointer;
-    user-select:none;
-    transition: opacity 140ms ease, background 140ms ease, box-shadow 140ms ease, transform 90ms ease;
-    box-shadow: 0 6px 16px rgba(0,0,0,0.14);
-  }}
-  .dock-pill:hover{{ opacity:1; background: rgba(255,255,255,0.10); box-shadow: 0 10px 22px rgba(0,0,0,0.26); }}
-  .dock-pill:active{{ transform: translateY(1px); }}
-  .dock-pill.dock-on{{ opacity:1; background: rgba(255,255,255,0.12); box-shadow: 0 10px 26px rgba(0,0,0,0.32); }} 
-      #mapdock {{
-        position: fixed;
-        bottom: 20px;
-        right: 20px;
-        z-index: 999999;
-        background: rgba(0,0,0,0.78);
-        padding: 10px 12px;
-        border: 1px solid rgba(255,255,255,0.18);
-        border-radius: 12px;
-        font-size: 13px;
-        color: #EDEDED;
-        font-family: Arial, sans-serif;
-        line-height: 1.35;
-        min-width: 260px;
-        max-width: 320px;
-        box-shadow: 0 6px 18px rgba(0,0,0,0.35);
-        pointer-events: auto;
-        backdrop-filter: blur(3px);
-      }}
-
-      #mapdock .top {{
-        display:flex;
-        align-items:center;
-        justify-content:space-between;
-        gap:10px;
-        margin-bottom: 8px;
-      }}
-      #mapdock .title {{
-        font-weight: 900;
-        letter-spacing: 0.3px;
-        opacity: .95;
-      }}
-      #mapdock .btn {{
-        cursor:pointer;
-        user-select:none;
-        padding: 4px 8px;
-        border-radius: 9px;
-        border: 1px solid rgba(255,255,255,0.14);
-        background: rgba(255,255,255,0.06);
-        font-weight: 800;
-        font-size: 12px;
-        opacity: .92;
-      }}
-      #mapdock.mapdock-collapsed .body {{ display:none; }}
-
-      #mapdock .tabs {{
-        display:flex;
-        gap:8px;
-        margin-bottom: 10px;
-      }}
-      #mapdock .tab {{
-        flex:1;
-        text-align:center;
-        padding: 6px 8px;
-        border-radius: 10px;
-        border: 1px solid rgba(255,255,255,0.14);
-        background: rgba(255,255,255,0.06);
-        cursor:pointer;
-        user-select:none;
-        font-weight: 900;
-        font-size: 12px;
-        opacity: .86;
-      }}
-      #mapdock .tab.active {{
-        opacity: 1;
-        background: rgba(255,255,255,0.12);
-      }}
-
-      #mapdock .panel {{ display:none; }}
-      #mapdock .panel.active {{ display:block; }}
-
-      /* Legend rows */
-      #mapdock .legendRow {{
-        display:flex;
-        align-items:center;
-        gap:8px;
-        margin:6px 0;
-      }}
-
-      /* Layers rows */
-      .ucdpLayerRow {{
-        display:flex;
-        align-items:center;
-        gap:10px;
-        padding: 6px 8px;
-        border-radius: 10px;
-        border: 1px solid rgba(255,255,255,0.10);
-        background: rgba(255,255,255,0.04);
-        margin: 6px 0;
-        cursor:pointer;
-        user-select:none;
-      }}
-      .ucdpLayerRow:hover {{
-        background: rgba(255,255,255,0.07);
-      }}
-      .ucdpLayerRow input {{
-        transform: scale(1.05);
-      }}
-
-      #mapdock .hint {{
-        margin-top: 8px;
-        opacity: .7;
-        font-size: 11px;
-      }}
-    </style>
-
-    <div id="mapdock">
-      <div class="top">
-        <div class="title">Legend & Layers</div>
-        <div class="dock-btn dock-on" id="mapdockToggle">Hide</div>
-      </div>
-
-      <div class="body">
-        <div class="tabs">
-          <div class="tab active" data-tab="legend">Legend</div>
-          <div class="tab" data-tab="layers">Layers</div>
-        </div>
-
-        <div class="panel active" id="panelLegend">
-          <div class="legendRow">
-            <span style="width:22px; height:0; border-top:3px solid {COLORS['front']}; display:inline-block;"></span>
-            <span>Frontline</span>
-          </div>
-
-          <div class="legendRow">
-            <span style="width:18px; height:12px; background:{COLORS['ru_fill']}; border:2px solid {COLORS['ru_line']}; display:inline-block;"></span>
-            <span>RU Control / Occupied</span>
-          </div>
-
-          <div class="legendRow">
-            <span style="width:18px; height:12px; background:{COLORS['ua_fill']}; border:2px solid {COLORS['ua_line']}; display:inline-block;"></span>
-            <span>UA Control / Presence</span>
-          </div>
-
-          <div class="legendRow">
-            <span style="width:22px; height:0; border-top:2px dashed {COLORS['ru_line']}; display:inline-block;"></span>
-            <span>RU Axis</span>
-          </div>
-
-          <div class="legendRow">
-            <span style="width:22px; height:0; border-top:2px dashed {COLORS['ua_line']}; display:inline-block;"></span>
-            <span>UA Axis</span>
-          </div>
-
-          <div class="legendRow">
-            <span style="width:22px; height:0; border-top:2px dashed {COLORS['hist_line']}; display:inline-block;"></span>
-            <span>Historic</span>
-          </div>
-
-          <div class="legendRow">
-            <span style="width:22px; height:0; border-top:2px solid {COLORS['ua_border']}; display:inline-block;"></span>
-            <span>Ukraine border</span>
-          </div>
-
-          <div class="legendRow">
-            <span style="width:22px; height:0; border-top:2px solid {COLORS['ru_border']}; display:inline-block;"></span>
-            <span>Russia border</span>
-          </div>
-
-          <div class="hint">Tip: Layers tab = toggles. Legend tab = meaning.</div>
-        </div>
-
-        <div class="panel" id="panelLayers">
-          {layers_html}
-          <div class="hint">Toggle overlays here (replaces Leaflet LayerControl).</div>
-        </div>
-      </div>
-    </div>
-
-    <script>
-      (function(){{
-        var MAP_NAME = {map_var!r};
-
-        function waitFor(name, tries, cb) {{
-          tries = tries || 200;
-          var t = setInterval(function() {{
-            if (window[name]) {{
-              clearInterval(t);
-              cb(window[name]);
-            }} else if (--tries <= 0) {{
-              clearInterval(t);
-              console.warn("mapdock: missing " + name);
-            }}
-          }}, 50);
-        }}
-
-        waitFor(MAP_NAME, 200, function(map){{
-          var dock = document.getElementById("mapdock");
-var btnToggle = document.getElementById("mapdockToggle");
-
-function applyState(collapsed){{
-  dock.classList.toggle("mapdock-collapsed", collapsed);
-  btnToggle.textContent = collapsed ? "Show" : "Hide";
-  btnToggle.classList.toggle("dock-on", !collapsed);
-}}
-
-// restore
-try {{
-  var st = localStorage.getItem("mapdock_collapsed");
-  applyState(st === "1");
-}} catch(e) {{
-  applyState(false);
-}}
-
-btnToggle.addEventListener("click", function(ev){{
-  ev.preventDefault(); ev.stopPropagation();
-  var collapsed = !dock.classList.contains("mapdock-collapsed");
-  applyState(collapsed);
-  try {{ localStorage.setItem("mapdock_collapsed", collapsed ? "1" : "0"); }} catch(e){{}}
-}});
-
-
-          // tabs
-          function setTab(which) {{
-            document.querySelectorAll("#mapdock .tab").forEach(function(t) {{
-              t.classList.toggle("active", t.getAttribute("data-tab") === which);
-            }});
-            document.getElementById("panelLegend").classList.toggle("active", which === "legend");
-            document.getElementById("panelLayers").classList.toggle("active", which === "layers");
-          }}
-          document.querySelectorAll("#mapdock .tab").forEach(function(t){{
-            t.addEventListener("click", function(ev){{
-              ev.preventDefault(); ev.stopPropagation();
-              setTab(t.getAttribute("data-tab"));
-            }});
-          }});
-
-          // keep map from stealing interactions when hovering dock
-          dock.addEventListener("mouseenter", function(){{
-            try {{
-              map.dragging.disable();
-              map.scrollWheelZoom.disable();
-              map.doubleClickZoom.disable();
-              map.boxZoom.disable();
-              map.keyboard.disable();
-            }} catch(e){{}}
-          }});
-          dock.addEventListener("mouseleave", function(){{
-            try {{
-              map.dragging.enable();
-              map.scrollWheelZoom.enable();
-              map.doubleClickZoom.enable();
-              map.boxZoom.enable();
-              map.keyboard.enable();
-            }} catch(e){{}}
-          }});
+    css, dock_html, js = read_dock_assets()
+    for key, value in COLORS.items():
+        dock_html = dock_html.replace(f"__COLOR_{key.upper()}__", value)
+    dock_html = dock_html.replace("__LAYERS_ROWS__", layers_html)
+    js = js.replace("'__MAP_NAME__'", repr(map_var))
+
+    html = f"<style>\n{css}</style>\n{dock_html}<script>\n{js}</script>\n"
+
+    m.get_root().html.add_child(RawHtml(html))
+
+def _js_json(obj) -> str:
+    """Compact JSON text for embedding in a <script> block."""
+    if HAS_ORJSON:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, separators=(",", ":"))
+
+def _json_bytes(obj) -> bytes:
+    """Compact UTF-8 JSON for payloads that get gzipped (orjson output is used as-is)."""
+    if HAS_ORJSON:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def _compute_ucdp_meta(features):
+    """Filter-panel defaults (date range, maxima, count) in one pass over the features."""
+    min_d = max_d = None
+    mb = mc = 0
+    for ft in features:
+        p = ft.get("properties") or {}
+        d = p.get("date", "")
+        if isinstance(d, str) and len(d) >= 10:
+            if min_d is None or d < min_d:
+                min_d = d
+            if max_d is None or d > max_d:
+                max_d = d
+        b = p.get("best", 0) or 0
+        if b > mb:
+            mb = b
+        c = p.get("civ", 0) or 0
+        if c > mc:
+            mc = c
+    return {
+        "min_date": min_d or "",
+        "max_date": max_d or "",
+        "max_best": int(mb),
+        "max_civ": int(mc),
+        "count": len(features),
+    }
 
-          // layers toggle hookup
-          function syncCheckboxes() {{
-            document.querySelectorAll("#panelLayers input[type='checkbox'][data-layer]").forEach(function(cb){{
-              var lname = cb.getAttribute("data-layer");
-              var layerObj = window[lname];
-              if (!layerObj) {{
-                // layer might be missing if name wrong
-                cb.checked = false;
-                cb.disabled = true;
-                return;
-              }}
-              cb.checked = map.hasLayer(layerObj);
-            }});
-          }}
+# Low-cardinality UCDP properties shipped as indexes into a per-field string table
+UCDP_CAT_FIELDS = ("conflict", "event_type", "side_a", "side_b", "source")
+# Free-text properties shipped as plain string columns
+UCDP_TEXT_FIELDS = ("where", "summary", "notes")
 
-          function attach() {{
-            document.querySelectorAll("#panelLayers input[type='checkbox'][data-layer]").forEach(function(cb){{
-              cb.addEventListener("change", function(ev){{
-                ev.preventDefault(); ev.stopPropagation();
-                var lname = cb.getAttribute("data-layer");
-                var layerObj = window[lname];
-                if (!layerObj) return;
-
-                if (cb.checked) map.addLayer(layerObj);
-                else map.removeLayer(layerObj);
-              }});
-            }});
+# Undated features sort after every real day and pass any date range
+UCDP_NO_DAY = 2**31 - 1
+_EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
 
-            // whenever overlays change (from code or elsewhere), resync
-            map.on("overlayadd", syncCheckboxes);
-            map.on("overlayremove", syncCheckboxes);
+def _ucdp_day(d) -> int:
+    """Days since 1970-01-01 for a 'YYYY-MM-DD...' string, UCDP_NO_DAY if missing/invalid."""
+    if not isinstance(d, str) or len(d) < 10:
+        return UCDP_NO_DAY
+    try:
+        return datetime.fromisoformat(d[:10]).toordinal() - _EPOCH_ORDINAL
+    except ValueError:
+        return UCDP_NO_DAY
 
-            // initial sync
-            syncCheckboxes();
-          }}
+def _ucdp_num(v, default):
+    """Same coercion as the panel's `(p.best || 0)`: falsy -> default."""
+    try:
+        return int(float(v or default))
+    except (TypeError, ValueError):
+        return default
 
-          // some layers may be defined after map init; poll a bit
-          var tries = 0;
-          var poll = setInterval(function(){{
-            tries++;
-            // if at least one layer resolves, attach, then stop
-            var any = false;
-            document.querySelectorAll("#panelLayers input[type='checkbox'][data-layer]").forEach(function(cb){{
-              var lname = cb.getAttribute("data-layer");
-              if (window[lname]) any = true;
-            }});
-            if (any || tries > 160) {{
-              clearInterval(poll);
-              attach();
-            }}
-          }}, 50);
-        }});
-      }})();
-    </script>
+def _ucdp_columns(features):
     """
-
-    m.get_root().html.add_child(folium.Element(html))
-
-
-import json
-from datetime import datetime
-from datetime import datetime
-import os, json
-import folium
+    Struct-of-arrays view of the UCDP points, sorted by date. Returns (packed, columns):
+      packed:  f32 lon | f32 lat | i32 day | i32 best | i32 civ | i8 prec  (n each, little-endian)
+      columns: {"n": n, "cats": {field: [values]}, "cols": {field: [index or string]}}
+    Features without a Point geometry are skipped.
+    """
+    rows = []
+    for ft in features:
+        geom = ft.get("geometry") or {}
+        coords = geom.get("coordinates") if geom.get("type") == "Point" else None
+        if not coords or len(coords) < 2:
+            continue
+        p = ft.get("properties") or {}
+        rows.append((_ucdp_day(p.get("date")), float(coords[0]), float(coords[1]), p))
+    rows.sort(key=lambda r: r[0])
+
+    # string tables: value -> index, in first-seen order
+    cat_index = {k: {} for k in UCDP_CAT_FIELDS}
+    cols = {k: [] for k in UCDP_CAT_FIELDS + UCDP_TEXT_FIELDS}
+    lon, lat, day = array("f"), array("f"), array("i")
+    best, civ, prec = array("i"), array("i"), array("b")
+
+    for d, x, y, p in rows:
+        lon.append(x); lat.append(y); day.append(d)
+        best.append(_ucdp_num(p.get("best"), 0))
+        civ.append(_ucdp_num(p.get("civ"), 0))
+        prec.append(max(-128, min(127, _ucdp_num(p.get("prec"), 9))))
+        for k in UCDP_CAT_FIELDS:
+            v = p.get(k)
+            if v is None:
+                v = ""
+            elif not isinstance(v, (str, int, float)):
+                v = str(v)
+            idx = cat_index[k]
+            i = idx.get(v)
+            if i is None:
+                i = idx[v] = len(idx)
+            cols[k].append(i)
+        for k in UCDP_TEXT_FIELDS:
+            cols[k].append(p.get(k) or "")
+
+    packed = [lon, lat, day, best, civ, prec]
+    if sys.byteorder == "big":
+        for col in packed:
+            col.byteswap()
+    columns = {"n": len(rows), "cats": {k: list(idx) for k, idx in cat_index.items()}, "cols": cols}
+    return b"".join(col.tobytes() for col in packed), columns
+
+def _pack_b64(data: bytes):
+    """(encoding, base64) for an embedded payload: "gzip" when it pays off, else "raw"."""
+    # mtime=0 keeps the output identical across rebuilds of the same data
+    gz = gzip.compress(data, 6, mtime=0)
+    if len(gz) <= len(data) * UCDP_GZIP_MAX_RATIO:
+        return "gzip", base64.b64encode(gz).decode("ascii")
+    return "raw", base64.b64encode(data).decode("ascii")
+
+# Decodes window.__ucdp_bin_b64 / __ucdp_cols_b64 (base64, gzipped when __ucdp_enc says so)
+# into window.__ucdp: typed-array views lon/lat/days/best/civ/prec plus the string tables
+# and columns, then fires "ucdp_ready". On failure sets window.__ucdp_error and fires
+# "ucdp_failed" instead.
+UCDP_INFLATE_JS = """<script>
+(function() {
+  function fail(msg, e) {
+    console.warn("UCDP: " + msg, e || "");
+    window.__ucdp_error = msg;
+    window.__ucdp_bin_b64 = window.__ucdp_cols_b64 = null;
+    window.dispatchEvent(new Event("ucdp_failed"));
+  }
+  var enc = window.__ucdp_enc || {};
+  if ((enc.bin === "gzip" || enc.cols === "gzip") && typeof DecompressionStream === "undefined") {
+    fail("DecompressionStream not supported by this browser");
+    return;
+  }
+  function inflate(b64, kind) {
+    var bin = atob(b64 || "");
+    var bytes = new Uint8Array(bin.length);
+    for (var i = 0; i < bin.length; i++) bytes[i] = bin.charCodeAt(i);
+    if (kind !== "gzip") return Promise.resolve(bytes.buffer);
+    var stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream("gzip"));
+    return new Response(stream).arrayBuffer();
+  }
+  Promise.all([
+    inflate(window.__ucdp_bin_b64, enc.bin),
+    inflate(window.__ucdp_cols_b64, enc.cols)
+  ]).then(function(res) {
+    var buf = res[0];
+    var d = JSON.parse(new TextDecoder().decode(res[1]));
+    var n = d.n;
+    window.__ucdp = {
+      n: n,
+      lon:  new Float32Array(buf, 0, n),
+      lat:  new Float32Array(buf, 4 * n, n),
+      days: new Int32Array(buf, 8 * n, n),
+      best: new Int32Array(buf, 12 * n, n),
+      civ:  new Int32Array(buf, 16 * n, n),
+      prec: new Int8Array(buf, 20 * n, n),
+      cats: d.cats,
+      cols: d.cols
+    };
+    window.__ucdp_bin_b64 = window.__ucdp_cols_b64 = null;
+    window.dispatchEvent(new Event("ucdp_ready"));
+  }).catch(function(e) {
+    fail("failed to decode the UCDP dataset", e);
+  });
+})();
+</script>"""
+
+def _add_ucdp_data(m, features, meta):
+    """
+    Emit the meta and the dataset. The points are shipped as packed typed-array
+    columns plus a JSON blob of string tables/columns, both base64 (inert inside
+    <script>), gzipped when worth it and then decoded with DecompressionStream.
+    """
+    packed, columns = _ucdp_columns(features)
+    bin_enc, bin_b64 = _pack_b64(packed)
+    cols_enc, cols_b64 = _pack_b64(_json_bytes(columns))
+    m.get_root().html.add_child(
+        RawHtml(
+            f"<script>window.__ucdp_meta = {_js_json(meta)};"
+            f"window.__ucdp_enc = {_js_json({'bin': bin_enc, 'cols': cols_enc})};"
+            f'window.__ucdp_bin_b64 = "{bin_b64}";'
+            f'window.__ucdp_cols_b64 = "{cols_b64}";'
+            f"</script>{UCDP_INFLATE_JS}"
+        )
+    )
 
 def add_ucdp_events_layer(m, ucdp_json_path=None):
     # Try common locations for UCDP dataset and fall back to the provided path
     candidates = [
+        os.path.join("data", "processed", "ucdp_events_filtered.ndjson"),
         os.path.join("data", "processed", "ucdp_events_filtered.json"),
         os.path.join("data", "ucdp_events_filtered.json"),
         os.path.join("assets", "ucdp_events_filtered.json"),
@@ -689,47 +862,29 @@ def add_ucdp_events_layer(m, ucdp_json_path=None):
         # create empty dataset and feature group so the UI/filter still appears
         fg_ucdp = folium.FeatureGroup(name="UCDP Events", show=False).add_to(m)
         fg_var = fg_ucdp.get_name()
-        empty_fc = {"type": "FeatureCollection", "features": []}
         empty_meta = {"min_date": "", "max_date": "", "max_best": 0, "max_civ": 0, "count": 0}
-        m.get_root().html.add_child(folium.Element(f"<script>window.__ucdp_fc = {json.dumps(empty_fc)};</script>"))
-        m.get_root().html.add_child(folium.Element(f"<script>window.__ucdp_meta = {json.dumps(empty_meta)};</script>"))
+        _add_ucdp_data(m, [], empty_meta)
         return fg_ucdp, fg_var
 
     print(f"Using UCDP dataset: {ucdp_json_path}")
     with open(ucdp_json_path, "r", encoding="utf-8") as f:
-        u = json.load(f)
+        if ucdp_json_path.endswith(".ndjson"):
+            # 02_filter_ucdp.py output: one event per line
+            u = {"events": [json.loads(line) for line in f if line.strip()]}
+        else:
+            u = json.load(f)
 
     # If the JSON is already a GeoJSON FeatureCollection, use it directly.
     if isinstance(u, dict) and u.get("type") == "FeatureCollection" and "features" in u:
-        fc = u
-        features = fc.get("features", [])
+        features = u.get("features", [])
 
         fg_ucdp = folium.FeatureGroup(name="UCDP Events", show=False).add_to(m)
         fg_var = fg_ucdp.get_name()
 
-        # dataset JS global
-        m.get_root().html.add_child(
-            folium.Element(f"<script>window.__ucdp_fc = {json.dumps(fc)};</script>")
-        )
-
-        # meta for defaults based on properties if available
-        dates = [ft.get("properties", {}).get("date", "") for ft in features]
-        dates = [d for d in dates if isinstance(d, str) and len(d) >= 10]
-
-        bests = [ft.get("properties", {}).get("best", 0) for ft in features]
-        civs  = [ft.get("properties", {}).get("civ", 0) for ft in features]
+        meta = _compute_ucdp_meta(features)
 
-        meta = {
-            "min_date": min(dates) if dates else "",
-            "max_date": max(dates) if dates else "",
-            "max_best": int(max(bests)) if bests else 0,
-            "max_civ": int(max(civs)) if civs else 0,
-            "count": len(features),
-        }
-
-        m.get_root().html.add_child(
-            folium.Element(f"<script>window.__ucdp_meta = {json.dumps(meta)};</script>")
-        )
+        # dataset + meta JS globals
+        _add_ucdp_data(m, features, meta)
 
         print(f"UCDP FeatureCollection: {len(features)} features")
         return fg_ucdp, fg_var
@@ -738,33 +893,14 @@ def add_ucdp_events_layer(m, ucdp_json_path=None):
     if isinstance(u, list):
         if u and isinstance(u[0], dict) and (u[0].get("type") == "Feature" or "geometry" in u[0]):
             # assume list of GeoJSON features
-            fc = {"type": "FeatureCollection", "features": u}
             features = u
 
             fg_ucdp = folium.FeatureGroup(name="UCDP Events", show=False).add_to(m)
             fg_var = fg_ucdp.get_name()
 
-            m.get_root().html.add_child(
-                folium.Element(f"<script>window.__ucdp_fc = {json.dumps(fc)};</script>")
-            )
-
-            dates = [ft.get("properties", {}).get("date", "") for ft in features]
-            dates = [d for d in dates if isinstance(d, str) and len(d) >= 10]
-
-            bests = [ft.get("properties", {}).get("best", 0) for ft in features]
-            civs  = [ft.get("properties", {}).get("civ", 0) for ft in features]
+            meta = _compute_ucdp_meta(features)
 
-            meta = {
-                "min_date": min(dates) if dates else "",
-                "max_date": max(dates) if dates else "",
-                "max_best": int(max(bests)) if bests else 0,
-                "max_civ": int(max(civs)) if civs else 0,
-                "count": len(features),
-            }
-
-            m.get_root().html.add_child(
-                folium.Element(f"<script>window.__ucdp_meta = {json.dumps(meta)};</script>")
-            )
+            _add_ucdp_data(m, features, meta)
 
             print(f"UCDP FeatureCollection (from list): {len(features)} features")
             return fg_ucdp, fg_var
@@ -849,34 +985,13 @@ def add_ucdp_events_layer(m, ucdp_json_path=None):
             }
         })
 
-    fc = {"type": "FeatureCollection", "features": features}
-
     fg_ucdp = folium.FeatureGroup(name="UCDP Events", show=False).add_to(m)
     fg_var = fg_ucdp.get_name()
 
-    # dataset JS global
-    m.get_root().html.add_child(
-        folium.Element(f"<script>window.__ucdp_fc = {json.dumps(fc)};</script>")
-    )
-
-    # meta for defaults
-    dates = [ft.get("properties", {}).get("date", "") for ft in features]
-    dates = [d for d in dates if isinstance(d, str) and len(d) >= 10]
+    meta = _compute_ucdp_meta(features)
 
-    bests = [ft.get("properties", {}).get("best", 0) for ft in features]
-    civs  = [ft.get("properties", {}).get("civ", 0) for ft in features]
-
-    meta = {
-        "min_date": min(dates) if dates else "",
-        "max_date": max(dates) if dates else "",
-        "max_best": int(max(bests)) if bests else 0,
-        "max_civ": int(max(civs)) if civs else 0,
-        "count": len(features),
-    }
-
-    m.get_root().html.add_child(
-        folium.Element(f"<script>window.__ucdp_meta = {json.dumps(meta)};</script>")
-    )
+    # dataset + meta JS globals
+    _add_ucdp_data(m, features, meta)
 
     print(f"UCDP dataset: {len(features)} points")
     return fg_ucdp, fg_var
@@ -893,7 +1008,7 @@ def add_ucdp_filter_panel(m, fg_var):
         top: 18px;
         right: 18px;
         z-index: 999999;
-        background: rgba(0,0,0,0.78);
+        background: rgba(0,0,0,0.86);
         padding: 12px 14px;
         border: 1px solid rgba(255,255,255,0.16);
         border-radius: 12px;
@@ -903,7 +1018,6 @@ def add_ucdp_filter_panel(m, fg_var):
         min-width: 300px;
         max-width: 380px;
         box-shadow: 0 10px 28px rgba(0,0,0,0.45);
-        backdrop-filter: blur(3px);
         pointer-events: auto;
       }}
       .leaflet-top.leaflet-right {{ margin-top: 92px; }}
@@ -1030,17 +1144,16 @@ def add_ucdp_filter_panel(m, fg_var):
         var MAP_NAME = {map_var!r};
         var GROUP_NAME = {fg_var!r};
 
-        function waitFor(name, tries, cb) {{
-          tries = tries || 200;
-          var t = setInterval(function() {{
-            if (window[name]) {{
-              clearInterval(t);
-              cb(window[name]);
-            }} else if (--tries <= 0) {{
-              clearInterval(t);
-              console.warn("UCDP: missing " + name);
-            }}
-          }}, 50);
+        // Folium defines the map and its layers in an inline script at the end of <body>,
+        // so they exist by DOMContentLoaded at the latest: check once now, once then.
+        function waitFor(name, cb) {{
+          if (window[name]) return cb(window[name]);
+          function check() {{
+            if (window[name]) cb(window[name]);
+            else console.warn("UCDP: missing " + name);
+          }}
+          if (document.readyState === "loading") document.addEventListener("DOMContentLoaded", check, {{ once: true }});
+          else check();
         }}
 
         function parseDate(s) {{
@@ -1063,22 +1176,49 @@ def add_ucdp_filter_panel(m, fg_var):
           return dateISO;
         }}
 
+        // Index columns (see UCDP_INFLATE_JS): days since epoch, UCDP_NO_DAY when undated
+        var UNDATED = {UCDP_NO_DAY};
+        function dayOf(dt) {{ return Math.floor(dt.getTime() / 86400000); }}
+        // First index whose value is >= x (or > x when after is true)
+        function bisect(arr, x, after) {{
+          var lo = 0, hi = arr.length;
+          while (lo < hi) {{
+            var mid = (lo + hi) >>> 1;
+            if (after ? arr[mid] <= x : arr[mid] < x) lo = mid + 1; else hi = mid;
+          }}
+          return lo;
+        }}
+
+        // Popups escape the same conflict/place/source names over and over: memoize
+        var escCache = new Map();
+        var ESC_MAP = {{"&": "&amp;", "<": "&lt;", ">": "&gt;"}};
+        function escChar(c) {{ return ESC_MAP[c]; }}
         function esc(s) {{
           s = (s === undefined || s === null) ? "" : String(s);
-          return s.replaceAll("&","&amp;").replaceAll("<","&lt;").replaceAll(">","&gt;");
+          var hit = escCache.get(s);
+          if (hit !== undefined) return hit;
+          var out = s.replace(/[&<>]/g, escChar);
+          if (escCache.size >= 4096) escCache.clear();
+          escCache.set(s, out);
+          return out;
+        }}
+
+        // Low-cardinality columns hold indexes into the field's string table
+        function cat(k, i) {{
+          return window.__ucdp.cats[k][window.__ucdp.cols[k][i]];
         }}
 
+        // where_prec code -> label (codes above 6, unknown and missing are "Very low")
+        var PREC_LABELS = ["High", "High", "High", "Medium", "Medium", "Low", "Low"];
         function precLabel(x) {{
           x = parseInt(x || 9, 10);
-          if (x <= 2) return "High";
-          if (x <= 4) return "Medium";
-          if (x <= 6) return "Low";
-          return "Very low";
+          return x < 0 ? "High" : (PREC_LABELS[x] || "Very low");
         }}
 
         function init(map, ucdpGroup) {{
-          if (!window.__ucdp_fc) {{
-            console.warn("UCDP: window.__ucdp_fc missing");
+          var D = window.__ucdp;
+          if (!D) {{
+            console.warn("UCDP: window.__ucdp missing");
             return;
           }}
           var meta = window.__ucdp_meta || {{}};
@@ -1134,26 +1274,219 @@ def add_ucdp_filter_panel(m, fg_var):
 
           // meta line
           if (elMetaLine) {{
-            var cnt = meta.count || (window.__ucdp_fc.features ? window.__ucdp_fc.features.length : 0);
+            var cnt = meta.count || D.n;
             elMetaLine.textContent = "Dataset: " + cnt + " events | Range: " + (minISO||"?") + " → " + (maxISO||"?");
           }}
 
-          var geoLayer = null;
+          // Marker style; radius = 2 + min(10, sqrt(best)) is flat from best = 100 on
+          var MARKER_STYLE = {{ weight: 1, color: "#FFD166", fillOpacity: 0.55 }};
+          var RADII = new Float32Array(101);
+          for (var r = 0; r <= 100; r++) RADII[r] = 2.0 + Math.min(10.0, Math.sqrt(r));
+          function radiusOf(i) {{
+            var b = D.best[i];
+            return RADII[b < 0 ? 0 : (b > 100 ? 100 : b)];
+          }}
+
+          // All filtered events are painted by one layer onto its own canvas, so there is no
+          // Leaflet object per event. Clicks are hit-tested against a screen-space grid that
+          // is rebuilt on every redraw (cells are larger than the biggest marker).
+          var TAU = 2 * Math.PI, CELL = 32, PAD = 0.5;
+          var PointsLayer = L.Layer.extend({{
+            initialize: function() {{
+              this._picked = new Int32Array(0);
+            }},
+            setPoints: function(picked) {{
+              this._picked = picked;
+              if (this._map) this._redraw();
+              return this;
+            }},
+            onAdd: function(map) {{
+              this._canvas = L.DomUtil.create("canvas", "leaflet-zoom-hide");
+              this._canvas.style.pointerEvents = "none";
+              map.getPanes().overlayPane.appendChild(this._canvas);
+              map.on("moveend resize", this._redraw, this);
+              map.on("click", this._onClick, this);
+              map.on("mousemove", this._onMove, this);
+              this._redraw();
+            }},
+            onRemove: function(map) {{
+              map.off("moveend resize", this._redraw, this);
+              map.off("click", this._onClick, this);
+              map.off("mousemove", this._onMove, this);
+              L.DomUtil.remove(this._canvas);
+              this._canvas = this._grid = null;
+            }},
+            _redraw: function() {{
+              var map = this._map, c = this._canvas;
+              var size = map.getSize();
+              var padX = Math.round(size.x * PAD), padY = Math.round(size.y * PAD);
+              var w = size.x + 2 * padX, h = size.y + 2 * padY;
+              var dpr = window.devicePixelRatio || 1;
+
+              L.DomUtil.setPosition(c, map.containerPointToLayerPoint([-padX, -padY]));
+              c.width = w * dpr;   // resizing also clears the canvas
+              c.height = h * dpr;
+              c.style.width = w + "px";
+              c.style.height = h + "px";
+
+              var ctx = c.getContext("2d");
+              ctx.setTransform(dpr, 0, 0, dpr, 0, 0);
+              ctx.lineWidth = MARKER_STYLE.weight;
+              ctx.strokeStyle = ctx.fillStyle = MARKER_STYLE.color;
+
+              // Viewport culling: events outside the padded canvas (plus the largest marker
+              // radius) are rejected on lat/lon before they are ever projected
+              var edge = RADII[100] + MARKER_STYLE.weight;
+              var nw = map.containerPointToLatLng([-padX - edge, -padY - edge]);
+              var se = map.containerPointToLatLng([size.x + padX + edge, size.y + padY + edge]);
+
+              // grid cells hold positions into xs/ys/ids, in drawing order
+              var picked = this._picked, lat = D.lat, lon = D.lon;
+              var cols = Math.ceil(w / CELL);
+              var xs = new Float32Array(picked.length), ys = new Float32Array(picked.length);
+              var ids = new Int32Array(picked.length);
+              var grid = new Map(), n = 0;
+              for (var k = 0; k < picked.length; k++) {{
+                var i = picked[k];
+                if (lat[i] > nw.lat || lat[i] < se.lat || lon[i] < nw.lng || lon[i] > se.lng) continue;
+                var p = map.latLngToContainerPoint([lat[i], lon[i]]);
+                var x = p.x + padX, y = p.y + padY, rad = radiusOf(i);
+
+                ctx.beginPath();
+                ctx.arc(x, y, rad, 0, TAU);
+                ctx.globalAlpha = MARKER_STYLE.fillOpacity;
+                ctx.fill();
+                ctx.globalAlpha = 1;
+                ctx.stroke();
+
+                xs[n] = x; ys[n] = y; ids[n] = i;
+                var key = Math.floor(y / CELL) * cols + Math.floor(x / CELL);
+                var cell = grid.get(key);
+                if (cell) cell.push(n); else grid.set(key, [n]);
+                n++;
+              }}
+              this._grid = {{ cells: grid, cols: cols, padX: padX, padY: padY, xs: xs, ys: ys, ids: ids }};
+            }},
+            // topmost (last drawn) event under a container point, or -1
+            _hit: function(cp) {{
+              var g = this._grid;
+              if (!g) return -1;
+              var x = cp.x + g.padX, y = cp.y + g.padY;
+              var cx = Math.floor(x / CELL), cy = Math.floor(y / CELL);
+              var top = -1;
+              for (var gy = cy - 1; gy <= cy + 1; gy++) {{
+                for (var gx = cx - 1; gx <= cx + 1; gx++) {{
+                  if (gx < 0 || gx >= g.cols) continue;
+                  var cell = g.cells.get(gy * g.cols + gx);
+                  if (!cell) continue;
+                  for (var c = 0; c < cell.length; c++) {{
+                    var n = cell[c];
+                    if (n <= top) continue;
+                    var dx = g.xs[n] - x, dy = g.ys[n] - y;
+                    var rr = radiusOf(g.ids[n]) + MARKER_STYLE.weight;
+                    if (dx * dx + dy * dy <= rr * rr) top = n;
+                  }}
+                }}
+              }}
+              return top < 0 ? -1 : g.ids[top];
+            }},
+            _onClick: function(e) {{
+              var i = this._hit(e.containerPoint);
+              if (i < 0) return;
+              L.popup({{ maxWidth: 360 }})
+                .setLatLng([D.lat[i], D.lon[i]])
+                .setContent(popupFor(i))
+                .openOn(this._map);
+            }},
+            _onMove: function(e) {{
+              var over = this._hit(e.containerPoint) >= 0;
+              if (over !== this._over) {{
+                this._over = over;
+                this._map.getContainer().style.cursor = over ? "pointer" : "";
+              }}
+            }}
+          }});
+
+          var geoLayer = new PointsLayer();
+          ucdpGroup.addLayer(geoLayer);
+
+          // Popup HTML for event i, built when its popup opens
+          function popupFor(i) {{
+            var eventType = cat("event_type", i), sideA = cat("side_a", i), sideB = cat("side_b", i);
+            var source = cat("source", i);
+            var where = D.cols.where[i], summary = D.cols.summary[i], notes = D.cols.notes[i];
+            var date = D.days[i] === UNDATED ? "" : toISODate(new Date(D.days[i] * 86400000));
+
+            var what =
+              summary || (
+                (eventType ? (eventType + " | ") : "") +
+                ((sideA || sideB) ? ((sideA||"") + (sideB ? " vs " + sideB : "")) : "") +
+                (where ? (" | " + where) : "")
+              );
+
+            var defs =
+              "<div style='margin-top:10px; padding-top:10px; border-top:1px solid rgba(0,0,0,0.10);'>" +
+              "<div style='font-weight:800; margin-bottom:6px;'>What these fields mean</div>" +
+              "<div style='opacity:.92; line-height:1.25;'>" +
+              "<div><b>Best</b>: UCDP best estimate for total fatalities (record-level).</div>" +
+              "<div><b>Civ</b>: estimated civilian fatalities (subset of total, when available).</div>" +
+              "<div><b>where_prec</b>: location precision code (lower = more precise).</div>" +
+              "</div></div>";
+
+            return (
+              "<div style='font-family:Arial;font-size:12px; max-width:340px;'>" +
+              "<div style='font-weight:900; font-size:13px; margin-bottom:2px;'>" + esc(cat("conflict", i)||"") + "</div>" +
+              "<div style='opacity:.82; margin-bottom:6px;'>" + esc(where||"") + "</div>" +
+
+              (what ? (
+                "<div style='margin:8px 0; padding:8px; border-radius:10px; background:rgba(0,0,0,0.06);'>" +
+                "<div style='font-weight:800; margin-bottom:4px;'>What happened</div>" +
+                "<div style='opacity:.95; line-height:1.25;'>" + esc(what) + "</div>" +
+                "</div>"
+              ) : "") +
+
+              "<div style='display:grid; grid-template-columns: 1fr 1fr; gap:6px;'>" +
+                "<div><b>Date:</b> " + esc(date) + "</div>" +
+                "<div style='text-align:right; opacity:.85;'><b>Loc precision:</b> " + esc(precLabel(D.prec[i])) + "</div>" +
+                "<div><b>Best:</b> " + esc(D.best[i]) + "</div>" +
+                "<div style='text-align:right;'><b>Civ:</b> " + esc(D.civ[i]) + "</div>" +
+                "<div><b>Prec:</b> " + esc(D.prec[i]) + "</div>" +
+                "<div></div>" +
+              "</div>" +
+
+              (source ? ("<div style='margin-top:8px; opacity:.75;'><b>Source:</b> " + esc(source) + "</div>") : "") +
+              (notes ? ("<div style='margin-top:8px; opacity:.85; line-height:1.25;'><b>Notes:</b> " + esc(notes) + "</div>") : "") +
+
+              defs +
+              "</div>"
+            );
+          }}
+
+          // Rebuilds go through requestBuild(): clicks within one frame collapse into a single build
+          var buildToken = 0;
+          var lastSig = null;   // filters behind geoLayer's current points
+          function requestBuild() {{
+            var my = ++buildToken;
+            requestAnimationFrame(function() {{
+              if (my === buildToken) buildLayer();
+            }});
+          }}
 
           function buildLayer() {{
             if (!map.hasLayer(ucdpGroup)) return;
 
-            if (geoLayer) {{
-              try {{ ucdpGroup.removeLayer(geoLayer); }} catch(e) {{}}
-              geoLayer = null;
-            }}
-
             var from = parseDate(elFrom.value);
             var to   = parseDate(elTo.value);
             var minBest = parseInt(elMinBest.value || "0", 10);
             var minCiv  = parseInt(elMinCiv.value || "0", 10);
             var maxPrec = parseInt(elMaxPrec.value || "9", 10);
 
+            // Same filters as last time (Apply without edits, overlay toggled back on):
+            // geoLayer still holds those points and repaints itself when re-added
+            var sig = elFrom.value + "|" + elTo.value + "|" + minBest + "|" + minCiv + "|" + maxPrec;
+            if (sig === lastSig) return;
+            lastSig = sig;
+
             // persist UI state
             try {{
               localStorage.setItem("ucdp_ui_state", JSON.stringify({{
@@ -1162,75 +1495,23 @@ def add_ucdp_filter_panel(m, fg_var):
               }}));
             }} catch(e) {{}}
 
-            geoLayer = L.geoJSON(window.__ucdp_fc, {{
-              filter: function(feat) {{
-                var p = (feat && feat.properties) ? feat.properties : {{}};
-                var dt = parseDate(p.date);
-                if (from && dt && dt < from) return false;
-                if (to && dt && dt > to) return false;
-                if ((p.best||0) < minBest) return false;
-                if ((p.civ||0) < minCiv) return false;
-                if ((p.prec||9) > maxPrec) return false;
-                return true;
-              }},
-              pointToLayer: function(feat, latlng) {{
-                var p = (feat && feat.properties) ? feat.properties : {{}};
-                var r = 2.0 + Math.min(10.0, Math.sqrt(p.best || 0));
-                return L.circleMarker(latlng, {{
-                  radius: r, weight: 1, color: "#FFD166", fillOpacity: 0.55
-                }});
-              }},
-              onEachFeature: function(feat, layer) {{
-                var p = (feat && feat.properties) ? feat.properties : {{}};
-
-                var what =
-                  p.summary || (
-                    (p.event_type ? (p.event_type + " | ") : "") +
-                    ((p.side_a || p.side_b) ? ((p.side_a||"") + (p.side_b ? " vs " + p.side_b : "")) : "") +
-                    (p.where ? (" | " + p.where) : "")
-                  );
-
-                var defs =
-                  "<div style='margin-top:10px; padding-top:10px; border-top:1px solid rgba(0,0,0,0.10);'>" +
-                  "<div style='font-weight:800; margin-bottom:6px;'>What these fields mean</div>" +
-                  "<div style='opacity:.92; line-height:1.25;'>" +
-                  "<div><b>Best</b>: UCDP best estimate for total fatalities (record-level).</div>" +
-                  "<div><b>Civ</b>: estimated civilian fatalities (subset of total, when available).</div>" +
-                  "<div><b>where_prec</b>: location precision code (lower = more precise).</div>" +
-                  "</div></div>";
-
-                var html =
-                  "<div style='font-family:Arial;font-size:12px; max-width:340px;'>" +
-                  "<div style='font-weight:900; font-size:13px; margin-bottom:2px;'>" + esc(p.conflict||"") + "</div>" +
-                  "<div style='opacity:.82; margin-bottom:6px;'>" + esc(p.where||"") + "</div>" +
-
-                  (what ? (
-                    "<div style='margin:8px 0; padding:8px; border-radius:10px; background:rgba(0,0,0,0.06);'>" +
-                    "<div style='font-weight:800; margin-bottom:4px;'>What happened</div>" +
-                    "<div style='opacity:.95; line-height:1.25;'>" + esc(what) + "</div>" +
-                    "</div>"
-                  ) : "") +
-
-                  "<div style='display:grid; grid-template-columns: 1fr 1fr; gap:6px;'>" +
-                    "<div><b>Date:</b> " + esc(p.date||"") + "</div>" +
-                    "<div style='text-align:right; opacity:.85;'><b>Loc precision:</b> " + esc(precLabel(p.prec)) + "</div>" +
-                    "<div><b>Best:</b> " + esc(p.best||0) + "</div>" +
-                    "<div style='text-align:right;'><b>Civ:</b> " + esc(p.civ||0) + "</div>" +
-                    "<div><b>Prec:</b> " + esc(p.prec||9) + "</div>" +
-                    "<div></div>" +
-                  "</div>" +
-
-                  (p.source ? ("<div style='margin-top:8px; opacity:.75;'><b>Source:</b> " + esc(p.source) + "</div>") : "") +
-                  (p.notes ? ("<div style='margin-top:8px; opacity:.85; line-height:1.25;'><b>Notes:</b> " + esc(p.notes) + "</div>") : "") +
-
-                  defs +
-                  "</div>";
-
-                layer.bindPopup(html, {{maxWidth: 360}});
+            // Points are sorted by day: bracket the date range, then scan the typed columns
+            var days = D.days, best = D.best, civ = D.civ, prec = D.prec;
+            var dated = bisect(days, UNDATED, false);
+            var lo = from ? bisect(days, dayOf(from), false) : 0;
+            var hi = to ? bisect(days, dayOf(to), true) : dated;
+
+            var picked = new Int32Array(Math.max(0, hi - lo) + (D.n - dated)), n = 0;
+            function scan(a, b) {{
+              for (var i = a; i < b; i++) {{
+                if (best[i] < minBest || civ[i] < minCiv || prec[i] > maxPrec) continue;
+                picked[n++] = i;
               }}
-            }});
+            }}
+            scan(lo, hi);
+            scan(dated, D.n);   // undated events pass any date range
 
-            ucdpGroup.addLayer(geoLayer);
+            geoLayer.setPoints(picked.subarray(0, n));
           }}
 
           function setRangeDays(days) {{
@@ -1249,13 +1530,13 @@ def add_ucdp_filter_panel(m, fg_var):
 
             elFrom.value = fromISO;
             elTo.value = toISO;
-            buildLayer();
+            requestBuild();
           }}
 
           // buttons
           document.getElementById("ucdpApply").addEventListener("click", function(ev) {{
             ev.preventDefault(); ev.stopPropagation();
-            buildLayer();
+            requestBuild();
           }});
           document.getElementById("ucdpReset").addEventListener("click", function(ev) {{
             ev.preventDefault(); ev.stopPropagation();
@@ -1268,7 +1549,7 @@ def add_ucdp_filter_panel(m, fg_var):
 
             elFrom.value = fromISO;
             elTo.value = toISO;
-            buildLayer();
+            requestBuild();
           }});
 
           // quick pills - CORRECTED SELECTOR HERE
@@ -1284,7 +1565,7 @@ def add_ucdp_filter_panel(m, fg_var):
             ev.preventDefault(); ev.stopPropagation();
             elFrom.value = meta.min_date || "";
             elTo.value = meta.max_date || toISODate(new Date());
-            buildLayer();
+            requestBuild();
           }});
 
           // collapse toggle (uniform)
@@ -1332,26 +1613,48 @@ def add_ucdp_filter_panel(m, fg_var):
             }} catch(e) {{}}
           }});
 
+          // live filtering while typing / dragging, debounced
+          var inputTimer = null;
+          [elFrom, elTo, elMinBest, elMinCiv, elMaxPrec].forEach(function(el) {{
+            el.addEventListener("input", function() {{
+              clearTimeout(inputTimer);
+              inputTimer = setTimeout(requestBuild, 150);
+            }});
+          }});
+
           // build when overlay toggled ON
           map.on('overlayadd', function(e) {{
             if (e.layer === ucdpGroup) {{
-              buildLayer();
+              requestBuild();
             }}
           }});
 
-          if (map.hasLayer(ucdpGroup)) buildLayer();
+          if (map.hasLayer(ucdpGroup)) requestBuild();
+        }}
+
+        // The dataset is decoded asynchronously (see UCDP_INFLATE_JS)
+        function whenData(cb) {{
+          if (window.__ucdp) return cb();
+          if (window.__ucdp_error) return showDataError();
+          window.addEventListener("ucdp_ready", function() {{ cb(); }}, {{ once: true }});
+          window.addEventListener("ucdp_failed", showDataError, {{ once: true }});
         }}
 
-        waitFor(MAP_NAME, 200, function(map) {{
-          waitFor(GROUP_NAME, 200, function(group) {{
-            init(map, group);
+        function showDataError() {{
+          var el = document.getElementById("ucdpMetaLine");
+          if (el) el.textContent = "UCDP data unavailable in this browser";
+        }}
+
+        waitFor(MAP_NAME, function(map) {{
+          waitFor(GROUP_NAME, function(group) {{
+            whenData(function() {{ init(map, group); }});
           }});
         }});
       }})();
     </script>
     """
 
-    m.get_root().html.add_child(folium.Element(html))
+    m.get_root().html.add_child(RawHtml(html))
     print("UCDP filter panel added (top-right).")
 
 def _fmt_int(n):
@@ -1366,19 +1669,21 @@ def _fmt_billions(x):
     except Exception:
         return str(x)
 
-def _pick_top3_categories(categories_dict):
+def _rank_categories(categories_dict, limit=10, min_usd=0.0):
     """
-    categories_dict = { "Tanks": { "usd_estimated": ... }, ... }
-    Return list of top 3 categories as [(name, usd_estimated), ...].
+    One pass over { "Tanks": { "usd_estimated": ... }, ... }: categories with a numeric
+    usd_estimated >= min_usd, highest first. Returns (top `limit` [(name, usd)], how many more).
     """
     rows = []
+    min_usd = float(min_usd)
     for name, obj in (categories_dict or {}).items():
-        usd = obj.get("usd_estimated")
-        if isinstance(usd, (int, float)):
-            rows.append((name, usd))
+        usd = obj.get("usd_estimated") if isinstance(obj, dict) else None
+        if isinstance(usd, (int, float)) and usd >= min_usd:
+            rows.append((name, float(usd)))
     rows.sort(key=lambda t: t[1], reverse=True)
-    return rows[:3]
-def add_stats_panel(m, json_path=None):
+    return rows[:limit], max(0, len(rows) - limit)
+
+def add_stats_panel(m, json_path=None, built_at=None):
     # Prefer processed war stats produced by other scripts. Fall back to legacy names.
     candidates = [os.path.join("data", "processed", "war_stats.json"), "stats_razboi.json", "data/war_stats.json"]
 
@@ -1409,7 +1714,7 @@ def add_stats_panel(m, json_path=None):
     except Exception:
         stats_ts_pretty = str(stats_ts)
 
-    map_ts_pretty = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
+    map_ts_pretty = (built_at or datetime.now(timezone.utc)).strftime("%Y-%m-%d %H:%M:%S UTC")
 
     # ---------- inputs ----------
     ru_p = (data.get("russia") or {}).get("personnel") or {}
@@ -1425,41 +1730,18 @@ def add_stats_panel(m, json_path=None):
     ua_categories = (ua_eq.get("categories") or {})
 
     # ---------- helpers ----------
-    def _pick_top_n_categories(categories_dict, n=10, min_usd=0.0):
-        rows = []
-        for name, obj in (categories_dict or {}).items():
-            usd = None
-            if isinstance(obj, dict):
-                usd = obj.get("usd_estimated")
-            if isinstance(usd, (int, float)) and usd >= float(min_usd):
-                rows.append((name, float(usd)))
-        rows.sort(key=lambda t: t[1], reverse=True)
-        return rows[:n]
-
-    def _count_with_usd(categories_dict, min_usd=0.0):
-        c = 0
-        for _, obj in (categories_dict or {}).items():
-            if isinstance(obj, dict) and isinstance(obj.get("usd_estimated"), (int, float)):
-                if float(obj["usd_estimated"]) >= float(min_usd):
-                    c += 1
-        return c
-
     def categories_html(categories_dict, limit=10, min_usd=50_000_000):
-        rows = _pick_top_n_categories(categories_dict, n=limit, min_usd=min_usd)
+        rows, remaining = _rank_categories(categories_dict, limit=limit, min_usd=min_usd)
         if not rows:
             return "<div style='opacity:.75'>n/a</div>"
 
-        out = []
-        for name, usd in rows:
-            out.append(
-                "<div style='display:flex; justify-content:space-between; gap:10px;'>"
-                f"<span style='opacity:.9'>{name}</span>"
-                f"<span style='font-weight:800'>${usd/1e9:.2f}B</span>"
-                "</div>"
-            )
-
-        total_ok = _count_with_usd(categories_dict, min_usd=min_usd)
-        remaining = max(0, total_ok - len(rows))
+        out = [
+            "<div style='display:flex; justify-content:space-between; gap:10px;'>"
+            f"<span style='opacity:.9'>{name}</span>"
+            f"<span style='font-weight:800'>${usd/1e9:.2f}B</span>"
+            "</div>"
+            for name, usd in rows
+        ]
         if remaining > 0:
             out.append(f"<div style='opacity:.7; margin-top:4px;'>+{remaining} more categories</div>")
 
@@ -1518,7 +1800,7 @@ def add_stats_panel(m, json_path=None):
         top: 18px;
         left: 18px;
         z-index: 999999;
-        background: rgba(0,0,0,0.78);
+        background: rgba(0,0,0,0.86);
         padding: 12px 14px;
         border: 1px solid rgba(255,255,255,0.16);
         border-radius: 12px;
@@ -1528,7 +1810,6 @@ def add_stats_panel(m, json_path=None):
         min-width: 290px;
         max-width: 360px;
         box-shadow: 0 10px 28px rgba(0,0,0,0.45);
-        backdrop-filter: blur(3px);
     ">
       <div style="display:flex; align-items:center; justify-content:space-between; gap:10px;">
         <div style="font-weight:900; letter-spacing:.3px;">
@@ -1647,26 +1928,46 @@ def add_stats_panel(m, json_path=None):
     </div>
     """
 
-    m.get_root().html.add_child(folium.Element(html))
+    m.get_root().html.add_child(RawHtml(html))
     print("Stats panel added (top-left).")
 
+def save_map(m, path, gzip_copy=False):
+    """
+    Same output as m.save(path), but the page template is streamed into the file piece by
+    piece (header, body html, script) instead of being joined into one string and then
+    encoded into a second, bytes copy. gzip_copy also writes path + ".gz" from the same
+    stream (fixed mtime, so unchanged maps give identical archives).
+    """
+    root = m.get_root()
+    # Figure.render() does this first: rendering children registers their header/script parts
+    for child in root._children.values():
+        child.render()
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        if not gzip_copy:
+            root._template.stream(this=root, kwargs={}).dump(f)
+            return
+        with gzip.GzipFile(path + ".gz", "wb", compresslevel=6, mtime=0) as gz, \
+                io.TextIOWrapper(gz, encoding="utf-8", newline="") as gz_text:
+            for chunk in root._template.stream(this=root, kwargs={}):
+                f.write(chunk)
+                gz_text.write(chunk)
+
 def build_map():
     if not os.path.exists(KML_FILE):
         print(f"Error: KML file not found: {KML_FILE}")
         return
 
-    tree = ET.parse(KML_FILE)
-    root = tree.getroot()
-
-    ns_url = root.tag.split("}")[0].strip("{")
+    built_at = datetime.now(timezone.utc)
+    ns_url = kml_namespace(KML_FILE)
     ns = {"kml": ns_url}
     prefix = f"{{{ns_url}}}"
 
-    # Styles
-    style_defs, style_maps = parse_kml_styles(root, ns)
+    # Styles (filled in while streaming the KML below)
+    style_defs, style_maps = {}, {}
 
     # Map
-    m = folium.Map(location=[48.5, 36.0], zoom_start=6, tiles="CartoDB dark_matter")
+    # Canvas instead of one SVG node per vector (thousands of UCDP markers, control polygons)
+    m = folium.Map(location=[48.5, 36.0], zoom_start=6, tiles="CartoDB dark_matter", prefer_canvas=True)
 
     # Layers
     fg_front  = folium.FeatureGroup(name="Frontline", show=True).add_to(m)
@@ -1683,7 +1984,7 @@ def build_map():
     fg_ucdp, fg_ucdp_var = add_ucdp_events_layer(m, None)
 
     # Prefer detected stats file (no hard-coded legacy filename)
-    add_stats_panel(m)
+    add_stats_panel(m, built_at=built_at)
     if fg_ucdp_var:
         add_ucdp_filter_panel(m, fg_ucdp_var)
 
@@ -1711,177 +2012,179 @@ def build_map():
     ignored_folder_counts = {}
     ignored_samples = {}  # folder_name -> list of up to 3 sample placemark names
 
+    fallback_points = {}  # (group name, color) -> (group, [[lat, lon, name], ...])
+
     def add_point(lat, lon, name, conf, target_group, fallback_color):
-        icon_path = conf.get("icon") if conf else None
-        if icon_path:
-            try:
-                # If local file exists, use it (assets/images/...)
-                if os.path.exists(icon_path):
-                    icon_obj = folium.CustomIcon(icon_image=icon_path, icon_size=(22, 22))
-                    folium.Marker([lat, lon], icon=icon_obj, popup=name, tooltip=name).add_to(target_group)
-                    return
-                # Allow external URLs or data URIs
-                if isinstance(icon_path, str) and (icon_path.startswith("http") or icon_path.startswith("data:") or icon_path.startswith("/")):
-                    icon_obj = folium.CustomIcon(icon_image=icon_path, icon_size=(22, 22))
-                    folium.Marker([lat, lon], icon=icon_obj, popup=name, tooltip=name).add_to(target_group)
-                    return
-            except Exception as e:
-                print(f"Warning: failed to load icon {icon_path}: {e}")
-
-        # fallback marker
-        folium.CircleMarker(
-            location=[lat, lon],
-            radius=3,
-            weight=1,
-            color=fallback_color,
-            fill=True,
-            fill_opacity=0.9,
-            popup=name,
-            tooltip=name,
-        ).add_to(target_group)
+        icon_url = marker_icon_url(conf.get("icon") if conf else None)
+        if icon_url:
+            # A CustomIcon attaches to its marker, so each marker gets its own (the URL is shared)
+            icon_obj = folium.CustomIcon(icon_image=icon_url, icon_size=(22, 22))
+            folium.Marker([lat, lon], icon=icon_obj, popup=name, tooltip=name).add_to(target_group)
+            return
+
+        # fallback marker: batched per (group, color), emitted after the KML pass
+        key = (target_group.get_name(), fallback_color)
+        if key not in fallback_points:
+            fallback_points[key] = (target_group, [])
+        fallback_points[key][1].append([lat, lon, name])
+
+    shapes = ShapeBatch()  # lines and polygons, added to the map after the KML pass
 
     def add_line(path, target_group, color, weight=2.5, opacity=0.9, dashed=False):
-        kwargs = {}
+        style = {"color": color, "weight": weight, "opacity": opacity}
         if dashed:
-            kwargs["dash_array"] = "6, 6"
-        folium.PolyLine(path, color=color, weight=weight, opacity=opacity, **kwargs).add_to(target_group)
+            style["dashArray"] = "6, 6"
+        shapes.add(path, target_group, style)
 
     def add_polygon(path, target_group, border_color, fill_color, fill_opacity, name):
-        folium.Polygon(
-            locations=path,
-            color=border_color,
-            weight=2,
-            fill=True,
-            fill_color=fill_color,
-            fill_opacity=fill_opacity,
-            popup=name,
-            tooltip=name if name else None,
-        ).add_to(target_group)
-
-    def process_elements(folder_element, folder_name):
+        style = {"color": border_color, "weight": 2, "fillColor": fill_color, "fillOpacity": fill_opacity}
+        shapes.add(path, target_group, style, polygon=True, name=name)
+
+    # Namespace-qualified child tags (geometry tags live in xp)
+    xp = kml_xpaths(ns_url)
+    style_url_path = f"{prefix}styleUrl"
+    name_path = f"{prefix}name"
+
+    def process_placemark(pm, name, folder_name, style_url):
         nonlocal stats
 
-        for pm in folder_element.findall(f"./{prefix}Placemark"):
-            name_el = pm.find(f"{prefix}name")
-            name = name_el.text.strip() if (name_el is not None and name_el.text) else ""
+        conf = resolve_style(style_url, style_defs, style_maps) or {}
 
-            style_el = pm.find(f"{prefix}styleUrl")
-            style_url = style_el.text.strip() if (style_el is not None and style_el.text) else None
-            conf = resolve_style(style_url, style_defs, style_maps) or {}
-
-            kind = classify_feature(folder_name, name)
-
-            # --- POINT ---
-            point = pm.find(f".//{prefix}Point/{prefix}coordinates")
-            if point is not None and point.text:
-                lon, lat, *_ = point.text.strip().split(",")
-                lat = float(lat); lon = float(lon)
-
-                # Prefer folder-based for units
-                if "ukrainian unit positions" in (folder_name or "").lower() or kind == "ua":
-                    add_point(lat, lon, name, conf, fg_ua, fallback_color=COLORS["ua_line"])
-                    stats["ua"] += 1
-                elif "russian unit positions" in (folder_name or "").lower() or kind == "ru":
-                    add_point(lat, lon, name, conf, fg_ru, fallback_color=COLORS["ru_line"])
-                    stats["ru"] += 1
-                else:
-                    add_point(lat, lon, name, conf, fg_axis, fallback_color="#FFAA00")
-                continue
+        kind = classify_feature(folder_name, name)
+        unit_side, is_front = folder_hints(folder_name)
 
-            # --- LINESTRING ---
-            line = pm.find(f".//{prefix}LineString/{prefix}coordinates")
-            if line is not None and line.text:
-                raw = line.text.strip().split()
-                path = [[float(c.split(",")[1]), float(c.split(",")[0])] for c in raw]
+        point, line, poly = placemark_geometry(pm, xp)
 
-                # Frontline always white
-                if "frontline" in (folder_name or "").lower():
-                    add_line(path, fg_front, color=COLORS["front"], weight=2.7, opacity=0.95, dashed=False)
-                    stats["front"] += 1
-                else:
-                    # Axes: UA blue dashed, RU red dashed, historic grey dashed
-                    if kind == "ua":
-                        add_line(path, fg_axis, color=COLORS["ua_line"], weight=2.5, opacity=0.9, dashed=True)
-                    elif kind == "historic":
-                        add_line(path, fg_axis, color=COLORS["hist_line"], weight=2.3, opacity=0.8, dashed=True)
-                    elif kind == "ru":
-                        add_line(path, fg_axis, color=COLORS["ru_line"], weight=2.5, opacity=0.9, dashed=True)
-                    else:
-                        add_line(path, fg_axis, color=COLORS["other_line"], weight=2.2, opacity=0.8, dashed=True)
-                    stats["axis"] += 1
-                continue
+        # --- POINT ---
+        if point is not None and point.text:
+            lon, lat, *_ = point.text.strip().split(",")
+            lat = float(lat); lon = float(lon)
+
+            # Prefer folder-based for units
+            if unit_side == "ua" or kind == "ua":
+                add_point(lat, lon, name, conf, fg_ua, fallback_color=COLORS["ua_line"])
+                stats["ua"] += 1
+            elif unit_side == "ru" or kind == "ru":
+                add_point(lat, lon, name, conf, fg_ru, fallback_color=COLORS["ru_line"])
+                stats["ru"] += 1
+            else:
+                add_point(lat, lon, name, conf, fg_axis, fallback_color="#FFAA00")
+            return
 
-            # --- POLYGON ---
-            poly = pm.find(f".//{prefix}Polygon//{prefix}coordinates")
-            if poly is not None and poly.text:
-                raw = poly.text.strip().split()
-                path = [[float(c.split(",")[1]), float(c.split(",")[0])] for c in raw]
+        # --- LINESTRING ---
+        if line is not None and line.text:
+            path = kml_path_latlon(line.text)
 
-                if kind == "ru":
-                    border = COLORS["ru_line"]; fill = COLORS["ru_fill"]; opacity = 0.28
-                elif kind == "ua":
-                    border = COLORS["ua_line"]; fill = COLORS["ua_fill"]; opacity = 0.22
+            # Frontline always white
+            if is_front:
+                add_line(path, fg_front, color=COLORS["front"], weight=2.7, opacity=0.95, dashed=False)
+                stats["front"] += 1
+            else:
+                # Axes: UA blue dashed, RU red dashed, historic grey dashed
+                if kind == "ua":
+                    add_line(path, fg_axis, color=COLORS["ua_line"], weight=2.5, opacity=0.9, dashed=True)
                 elif kind == "historic":
-                    border = COLORS["hist_line"]; fill = COLORS["hist_fill"]; opacity = 0.18
+                    add_line(path, fg_axis, color=COLORS["hist_line"], weight=2.3, opacity=0.8, dashed=True)
+                elif kind == "ru":
+                    add_line(path, fg_axis, color=COLORS["ru_line"], weight=2.5, opacity=0.9, dashed=True)
                 else:
-                    border = COLORS["other_line"]; fill = COLORS["other_fill"]; opacity = 0.18
+                    add_line(path, fg_axis, color=COLORS["other_line"], weight=2.2, opacity=0.8, dashed=True)
+                stats["axis"] += 1
+            return
+
+        # --- POLYGON ---
+        if poly is not None and poly.text:
+            path = kml_path_latlon(poly.text)
+
+            if kind == "ru":
+                border = COLORS["ru_line"]; fill = COLORS["ru_fill"]; opacity = 0.28
+            elif kind == "ua":
+                border = COLORS["ua_line"]; fill = COLORS["ua_fill"]; opacity = 0.22
+            elif kind == "historic":
+                border = COLORS["hist_line"]; fill = COLORS["hist_fill"]; opacity = 0.18
+            else:
+                border = COLORS["other_line"]; fill = COLORS["other_fill"]; opacity = 0.18
+
+            # Polygons always in Control Areas layer
+            add_polygon(path, fg_ctrl, border, fill, opacity, name)
+            stats["polys"] += 1
+            return
+
+    # One directory listing instead of a stat() per icon style
+    image_set = set(os.listdir(IMAGES_FOLDER)) if os.path.isdir(IMAGES_FOLDER) else set()
+    placemark_tag = f"{prefix}Placemark"
+    allowed_folders = {}
+    # Placemarks whose styleUrl is not resolvable yet (Style/StyleMap declared further down,
+    # or nowhere): copied, since iter_kml clears elements, and finished after the pass
+    deferred = []
+
+    for el, folders, in_folder in iter_kml(KML_FILE, ns):
+        if el.tag != placemark_tag:
+            read_kml_style(el, xp, image_set, style_defs, style_maps)
+            continue
+        if not folders:
+            continue
 
-                # Polygons always in Control Areas layer
-                add_polygon(path, fg_ctrl, border, fill, opacity, name)
-                stats["polys"] += 1
-                continue
+        name_el = el.find(name_path)
+        name = name_el.text.strip() if (name_el is not None and name_el.text) else ""
 
-    def process_folder(element):
-        nonlocal stats, ignored_folder_counts, ignored_samples
+        for folder_name in folders:
+            ok = allowed_folders.get(folder_name)
+            if ok is None:
+                ok = allowed_folders[folder_name] = is_allowed_folder(folder_name)
+            if ok:
+                continue
+            # Every excluded ancestor folder accounts for the placemark
+            stats["ignored"] += 1
+            ignored_folder_counts[folder_name] = ignored_folder_counts.get(folder_name, 0) + 1
+            samples = ignored_samples.setdefault(folder_name, [])
+            if len(samples) < 3:
+                samples.append(name or "<no name>")
+
+        if in_folder and allowed_folders[folders[-1]]:
+            style_el = el.find(style_url_path)
+            style_url = style_el.text.strip() if (style_el is not None and style_el.text) else None
+            if style_url and resolve_style(style_url, style_defs, style_maps) is None:
+                deferred.append((copy.deepcopy(el), name, folders[-1], style_url))
+            else:
+                process_placemark(el, name, folders[-1], style_url)
 
-        for folder in element.findall(f"./{prefix}Folder"):
-            name_el = folder.find(f"{prefix}name")
-            folder_name = name_el.text.strip() if (name_el is not None and name_el.text) else ""
+    for pm, name, folder_name, style_url in deferred:
+        process_placemark(pm, name, folder_name, style_url)
 
-            if is_allowed_folder(folder_name):
-                process_elements(folder, folder_name)
-            else:
-                pls = folder.findall(f".//{prefix}Placemark")
-                cnt = len(pls)
-                stats["ignored"] += cnt
-                if cnt > 0:
-                    ignored_folder_counts[folder_name] = ignored_folder_counts.get(folder_name, 0) + cnt
-                    if folder_name not in ignored_samples:
-                        ignored_samples[folder_name] = []
-                    for pm in pls[:3]:
-                        n_el = pm.find(f"{prefix}name")
-                        nm = n_el.text.strip() if (n_el is not None and n_el.text) else "<no name>"
-                        if len(ignored_samples[folder_name]) < 3:
-                            ignored_samples[folder_name].append(nm)
-
-            process_folder(folder)
-
-    doc = root.find(f"./{prefix}Document")
-    start_node = doc if doc is not None else root
-    process_folder(start_node)
+    if shapes.items:
+        shapes.add_to(m)
+    for (_, color), (group, points) in fallback_points.items():
+        CircleMarkerBatch(points, color).add_to(group)
 
     # Ensure images from IMAGES_FOLDER are copied next to the output map (outputs/images/)
     try:
         src_img_dir = IMAGES_FOLDER
         dst_img_dir = os.path.join(os.path.dirname(OUTPUT_MAP), "images")
-        if os.path.exists(src_img_dir) and os.path.isdir(src_img_dir):
+        if os.path.isdir(src_img_dir):
             os.makedirs(dst_img_dir, exist_ok=True)
             import shutil
-            for fname in os.listdir(src_img_dir):
-                src = os.path.join(src_img_dir, fname)
-                if not os.path.isfile(src):
-                    continue
-                if fname.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp', '.ico')):
-                    dst = os.path.join(dst_img_dir, fname)
+            # copy2 keeps mtimes, so an unchanged image from the previous build is skipped
+            # (shutil.copy2 itself already copies via os.sendfile on Linux)
+            with os.scandir(dst_img_dir) as it:
+                existing = {e.name: e.stat() for e in it if e.is_file()}
+            with os.scandir(src_img_dir) as it:
+                for entry in it:
+                    if os.path.splitext(entry.name)[1].lower() not in IMAGE_EXTS or not entry.is_file():
+                        continue
+                    st, old = entry.stat(), existing.get(entry.name)
+                    if old is not None and old.st_size == st.st_size and old.st_mtime_ns == st.st_mtime_ns:
+                        continue
+                    dst = os.path.join(dst_img_dir, entry.name)
                     try:
-                        shutil.copy2(src, dst)
+                        shutil.copy2(entry.path, dst)
                     except Exception as e:
-                        print(f"Warning: failed copying image {src} to {dst}: {e}")
+                        print(f"Warning: failed copying image {entry.path} to {dst}: {e}")
     except Exception as e:
         print(f"Warning: failed to prepare images folder: {e}")
 
     #folium.LayerControl(collapsed=False).add_to(m)
-    m.save(OUTPUT_MAP)
+    save_map(m, OUTPUT_MAP, gzip_copy=GZIP_OUTPUT)
 
     print("\nDone.")
     print(f"  UA units: {stats['ua']}")
@@ -0,0 +1,24 @@
+"""
+Shared HTTP session for the fetch scripts (00, 01, 03).
+
+The scripts import it as a sibling module, so run them as `python scripts/<name>.py`.
+"""
+
+from __future__ import annotations
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+def make_session(retries: int = 3, pool: int = 8) -> requests.Session:
+    """
+    Pooled keep-alive session; urllib3 handles retries and back-off (incl. 429 Retry-After).
+    `pool` should be at least the number of threads sharing the session.
+    """
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
+    adapter = HTTPAdapter(pool_connections=pool, pool_maxsize=pool, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
@@ -0,0 +1,6 @@
+"""The scripts import shared helpers (http_session) as sibling modules."""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "scripts"))
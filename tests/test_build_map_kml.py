@@ -0,0 +1,42 @@
+"""Regression tests for KML parsing in scripts/10_build_map.py."""
+
+import base64
+import importlib.util
+import shutil
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+# 1x1 transparent PNG
+PNG_1PX = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+
+
+def load_build_map():
+    spec = importlib.util.spec_from_file_location("build_map", ROOT / "scripts" / "10_build_map.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_style_declared_after_its_placemarks(tmp_path, monkeypatch):
+    assets = tmp_path / "assets"
+    (assets / "images").mkdir(parents=True)
+    (tmp_path / "outputs").mkdir()
+    shutil.copy(FIXTURES / "trailing_style.kml", assets / "doc.kml")
+    (assets / "images" / "ua-unit.png").write_bytes(PNG_1PX)
+    for ext in ("css", "html", "js"):
+        shutil.copy(ROOT / "assets" / f"dock.{ext}", assets / f"dock.{ext}")
+    monkeypatch.chdir(tmp_path)
+
+    load_build_map().build_map()
+    html = (tmp_path / "outputs" / "index.html").read_text(encoding="utf-8")
+
+    icon_url = "data:image/png;base64," + base64.b64encode(PNG_1PX).decode("ascii")
+    # Both the direct Style and the StyleMap reference resolve to the trailing icon style
+    assert html.count(icon_url) == 2
+    # The placemark with an undefined style still falls back to a circle marker
+    assert "UA Bde (no such style)" in html
+    assert html.count("L.circleMarker(") == 1
@@ -0,0 +1,43 @@
+"""Tests for the incremental merge helpers in scripts/01_fetch_ucdp.py."""
+
+import importlib.util
+import io
+import json
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+EVENTS = Path(__file__).resolve().parent / "fixtures" / "ucdp_events.ndjson"
+
+
+def load_fetch_ucdp():
+    spec = importlib.util.spec_from_file_location("fetch_ucdp", ROOT / "scripts" / "01_fetch_ucdp.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_last_event_date():
+    assert load_fetch_ucdp().last_event_date(EVENTS) == "2023-03-01"
+
+
+def test_copy_older_events_skips_refetched_ids():
+    dst = io.BytesIO()
+    # 103/104 fall in the re-fetched window; 105 came back in the new pages
+    n = load_fetch_ucdp().copy_older_events(EVENTS, dst, "2023-03-01", {103, 104, 105})
+    ids = [json.loads(line)["id"] for line in dst.getvalue().splitlines()]
+    assert n == 2
+    assert ids == [101, 102]
+
+
+def test_resume_date_requires_matching_query():
+    m = load_fetch_ucdp()
+    query = {"Country": "369,365", "StartDate": "2022-02-24"}
+    assert m.resume_date(EVENTS, query, "369,365", "2022-02-24") == "2023-03-01"
+    assert m.resume_date(EVENTS, query, "369,365", "2022-06-01") == "2023-03-01"
+    # An earlier --start-date or other countries need the full range again
+    assert m.resume_date(EVENTS, query, "369,365", "2020-01-01") is None
+    assert m.resume_date(EVENTS, query, "369", "2022-02-24") is None
+    # No stored query (no .meta.json): nothing to compare against
+    assert m.resume_date(EVENTS, {}, "369,365", "2022-02-24") is None
+    # Nothing newer than the requested start
+    assert m.resume_date(EVENTS, query, "369,365", "2023-06-01") is None